@@ -1,8 +1,14 @@
+import re
+
+
 class Node:
-    pass
+    # __slots__ everywhere: no per-node __dict__ on large programs
+    __slots__ = ("line", "col")
 
 
 class Program(Node):
+    __slots__ = ("stmts",)
+
     def __init__(self, stmts):
         self.stmts = stmts
         self.line = None
@@ -13,6 +19,8 @@ class Program(Node):
 
 
 class Step(Node):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
         self.line = None
@@ -23,6 +31,8 @@ class Step(Node):
 
 
 class Goto(Node):
+    __slots__ = ("target",)
+
     def __init__(self, target):
         self.target = target
         self.line = None
@@ -33,6 +43,8 @@ class Goto(Node):
 
 
 class Print(Node):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
         self.line = None
@@ -43,6 +55,8 @@ class Print(Node):
 
 
 class Repeat(Node):
+    __slots__ = ("count", "block")
+
     def __init__(self, count, block):
         self.count = count
         self.block = block
@@ -54,6 +68,8 @@ class Repeat(Node):
 
 
 class If(Node):
+    __slots__ = ("cond", "block")
+
     def __init__(self, cond, block):
         self.cond = cond
         self.block = block
@@ -65,6 +81,8 @@ class If(Node):
 
 
 class Assign(Node):
+    __slots__ = ("name", "expr")
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
@@ -76,6 +94,8 @@ class Assign(Node):
 
 
 class BinOp(Node):
+    __slots__ = ("op", "left", "right")
+
     def __init__(self, op, left, right):
         self.op = op
         self.left = left
@@ -88,6 +108,8 @@ class BinOp(Node):
 
 
 class Number(Node):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
         self.line = None
@@ -98,6 +120,8 @@ class Number(Node):
 
 
 class String(Node):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
         self.line = None
@@ -108,6 +132,8 @@ class String(Node):
 
 
 class Var(Node):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
         self.line = None
@@ -115,3 +141,111 @@ class Var(Node):
 
     def __repr__(self):
         return f"Var({self.name})@{getattr(self,'line',None)}"
+
+
+class Dispatch(dict):
+    # Handlers of one pass keyed on the exact node class, registered with
+    # @table.on(Class, ...): a pass finds a node's handler with one dict
+    # lookup, table[type(node)], instead of an isinstance ladder. Classes
+    # without a handler get `default`.
+    __slots__ = ("default",)
+
+    def __init__(self, default=None):
+        super().__init__()
+        self.default = default
+
+    def on(self, *classes):
+        def register(fn):
+            for cls in classes:
+                self[cls] = fn
+            return fn
+
+        return register
+
+    def __missing__(self, cls):
+        return self.default
+
+
+# string literals and comments of source text, whose braces do not count
+NOT_CODE = re.compile(r'"(?:[^"\\]|\\.)*"|#.*')
+
+
+def _no_children(n):
+    return ()
+
+
+# nodes directly nested in a node
+CHILDREN = Dispatch(_no_children)
+
+
+@CHILDREN.on(BinOp)
+def _binop_children(n):
+    return (n.left, n.right)
+
+
+@CHILDREN.on(Print, Assign)
+def _expr_children(n):
+    return (n.expr,)
+
+
+@CHILDREN.on(Repeat)
+def _repeat_children(n):
+    return n.block
+
+
+@CHILDREN.on(If)
+def _if_children(n):
+    return [n.cond] + n.block
+
+
+# names a node looks up or defines: handler(node, refs, steps)
+NAMES = Dispatch(lambda n, refs, steps: None)
+
+
+@NAMES.on(Step)
+def _step_name(n, refs, steps):
+    steps.append(n.name)
+
+
+@NAMES.on(Goto)
+def _goto_name(n, refs, steps):
+    refs[n.target] = None
+
+
+@NAMES.on(Var)
+def _var_name(n, refs, steps):
+    refs[n.name] = None
+
+
+def names_of(stmts):
+    # (names the statements look up, steps they define)
+    refs, steps = {}, []
+    work = list(stmts)
+    while work:
+        n = work.pop()
+        NAMES[type(n)](n, refs, steps)
+        work += CHILDREN[type(n)](n)
+    return tuple(refs), frozenset(steps)
+
+
+def import_past_ast(name):
+    # Import module `name` when it needs the stdlib's ast (through inspect,
+    # as numpy and asyncio do), which this module shadows whenever its
+    # directory is on sys.path: the directory is left out for the import and
+    # this module put back afterwards. Raises ImportError like import.
+    import importlib
+    import os
+    import sys
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    path = sys.path[:]
+    ours = sys.modules.pop("ast", None)
+    sys.path[:] = [p for p in path if os.path.abspath(p or os.curdir) != here]
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path[:] = path
+        if ours is None:
+            sys.modules.pop("ast", None)
+        else:
+            sys.modules["ast"] = ours
@@ -0,0 +1,145 @@
+# Batch mode: run many .mf workflows over a process pool
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from main import compile_and_run
+from sinks import ListSink
+from telemetry import Telemetry
+
+
+def collect(paths):
+    # directories (searched recursively), glob patterns and plain files
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            found = glob.glob(os.path.join(p, "**", "*.mf"), recursive=True)
+        elif glob.has_magic(p):
+            found = glob.glob(p, recursive=True)
+        else:
+            found = [p]
+        for f in sorted(found):
+            if f not in files:
+                files.append(f)
+    return files
+
+
+def run_file(path, backend="tac"):
+    # worker: compile and run one file; never raises, failures are reported
+    # in the result so one workflow cannot stop the others
+    res = {
+        "path": path,
+        "status": "ok",
+        "output": [],
+        "diagnostics": [],
+        "error": None,
+        "wall": 0.0,
+        "instructions": None,
+    }
+    start = time.perf_counter()
+    sink = ListSink()  # keeps the partial output if the run fails
+    res["output"] = sink.lines
+    # only the pipeline statistics: no memory tracing or object counts
+    telemetry = Telemetry(memory=False, objects=False)
+
+    @telemetry.add_hook
+    def executed(record):
+        if "instructions_executed" in record:
+            res["instructions"] = record["instructions_executed"]
+
+    try:
+        with open(path) as f:
+            # nothing but the output and diagnostics is reported, so no
+            # intermediate representation is kept
+            out, tac, tacopt, st, diagnostics, removed, prog, linked = compile_and_run(
+                f, backend, sink=sink, telemetry=telemetry, keep=()
+            )
+        res["diagnostics"] = diagnostics
+        if diagnostics:
+            res["status"] = "diagnostics"
+    except Exception as e:
+        res["status"] = "error"
+        res["error"] = f"{type(e).__name__}: {e}"
+        res["traceback"] = traceback.format_exc()
+    res["wall"] = time.perf_counter() - start
+    return res
+
+
+def _crashed(path, e):
+    # the worker process running the file died
+    return {
+        "path": path,
+        "status": "crashed",
+        "output": [],
+        "diagnostics": [],
+        "error": f"{type(e).__name__}: {e}",
+        "wall": 0.0,
+        "instructions": None,
+    }
+
+
+def run_isolated(path, backend="tac"):
+    # run_file in a worker process of its own, so that only this file is
+    # lost if the process dies
+    try:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            return pool.submit(run_file, path, backend).result()
+    except BrokenProcessPool as e:
+        return _crashed(path, e)
+
+
+def run_batch(paths, workers=None, backend="tac"):
+    # returns one result dict per file, in input order. A worker that dies
+    # (OOM, SIGKILL) breaks the shared pool and fails every file it had not
+    # finished, without telling which one killed it; those files are run
+    # again, each in a process of its own, and only the culprit crashes.
+    files = collect(paths)
+    results = {}
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_file, f, backend): f for f in files}
+        for fut in as_completed(futures):
+            path = futures[fut]
+            try:
+                results[path] = fut.result()
+            except BrokenProcessPool:
+                unfinished.append(path)
+            except Exception as e:
+                results[path] = _crashed(path, e)
+    if unfinished:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as threads:
+            for path, res in zip(
+                unfinished, threads.map(run_isolated, unfinished, [backend] * len(unfinished))
+            ):
+                results[path] = res
+    return [results[f] for f in files]
+
+
+def write_report(r, f):
+    for line in r["output"]:
+        f.write(f"{line}\n")
+    for d in r["diagnostics"]:
+        f.write(f"ERROR: {d}\n")
+    if r["error"]:
+        f.write(f"FAILED: {r['error']}\n")
+
+
+def summary(results, wall):
+    lines = ["=== BATCH SUMMARY ==="]
+    width = max([len(r["path"]) for r in results] + [4])
+    lines.append(f"{'file':<{width}}  {'status':<11} {'wall(s)':>8} {'instrs':>7}")
+    for r in results:
+        instructions = "-" if r["instructions"] is None else r["instructions"]
+        lines.append(
+            f"{r['path']:<{width}}  {r['status']:<11} {r['wall']:>8.3f} {instructions:>7}"
+        )
+    failed = sum(r["status"] in ("error", "crashed") for r in results)
+    lines.append(
+        f"{len(results)} file(s), {failed} failed, "
+        f"{sum(r['instructions'] or 0 for r in results)} instruction(s) executed, "
+        f"{sum(r['wall'] for r in results):.3f}s in workflows, {wall:.3f}s elapsed"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,2 @@
+# Benchmarks for the MiniFlow compiler; run from the repository root,
+# e.g. `python -m bench.lexer_bench`.
@@ -0,0 +1,123 @@
+# Bytes per AST node / token: __slots__ classes with interned identifiers
+# versus the previous plain classes with a per-instance __dict__
+import argparse
+import gc
+import tracemalloc
+
+import ast as nodes
+from lexer import tokenize
+from parser import parse_code
+from bench.lexer_bench import synthetic
+
+NODE_FIELDS = {
+    nodes.Program: ("stmts",),
+    nodes.Step: ("name",),
+    nodes.Goto: ("target",),
+    nodes.Print: ("expr",),
+    nodes.Repeat: ("count", "block"),
+    nodes.If: ("cond", "block"),
+    nodes.Assign: ("name", "expr"),
+    nodes.BinOp: ("op", "left", "right"),
+    nodes.Number: ("value",),
+    nodes.String: ("value",),
+    nodes.Var: ("name",),
+}
+
+# dict-based stand-ins with the same attributes, set in the same order
+PLAIN = {cls: type("Plain" + cls.__name__, (), {}) for cls in NODE_FIELDS}
+PlainToken = type("PlainToken", (), {})
+
+
+def plain_clone(root):
+    # copy a tree into dict-based nodes; every identifier and literal gets
+    # its own object, as when each node kept its token's value. Explicit
+    # stack of (value, container, key) to copy into: no recursion limit
+    out = [None]
+    work = [(root, out, 0)]
+    while work:
+        n, into, key = work.pop()
+        if isinstance(n, list):
+            c = [None] * len(n)
+            work.extend((x, c, i) for i, x in enumerate(n))
+        elif isinstance(n, str):
+            c = "".join(list(n))
+        elif isinstance(n, int):
+            c = n + 0
+        elif type(n) not in PLAIN:
+            c = n
+        else:
+            c = PLAIN[type(n)]()
+            for f in NODE_FIELDS[type(n)]:
+                v = getattr(n, f)
+                # operator names were always shared token-type strings
+                if f == "op":
+                    setattr(c, f, v)
+                else:
+                    setattr(c, f, None)
+                    work.append((v, c, f))
+            c.line = n.line
+            c.col = n.col
+        if type(into) is list:
+            into[key] = c
+        else:
+            setattr(into, key, c)
+    return out[0]
+
+
+def plain_tokens(tokens):
+    out = []
+    for t in tokens:
+        c = PlainToken()
+        c.type, c.value, c.line, c.col = t.type, "".join(list(t.value)), t.line, t.col
+        out.append(c)
+    return out
+
+
+def count_nodes(root):
+    count = 0
+    todo = [root]
+    while todo:
+        n = todo.pop()
+        if isinstance(n, list):
+            todo.extend(n)
+        elif isinstance(n, nodes.Node):
+            count += 1
+            todo.extend(getattr(n, f) for f in NODE_FIELDS[type(n)])
+    return count
+
+
+def held(fn, *args):
+    # bytes still allocated once fn's result is built (result is kept alive)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn(*args)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    ap = argparse.ArgumentParser(description="AST/token memory benchmark")
+    ap.add_argument("--lines", type=int, nargs="+", default=[10000, 100000])
+    args = ap.parse_args()
+    print(
+        f"{'lines':>8} {'nodes':>8} {'B/node before':>14} {'B/node after':>13} "
+        f"{'tokens':>8} {'B/tok before':>13} {'B/tok after':>12}"
+    )
+    for n in args.lines:
+        code = synthetic(n)
+        tree, after = held(parse_code, code)
+        _, before = held(plain_clone, tree)
+        count = count_nodes(tree)
+        toks, tok_after = held(tokenize, code)
+        _, tok_before = held(plain_tokens, toks)
+        print(
+            f"{n:>8} {count:>8} {before / count:>14.1f} {after / count:>13.1f} "
+            f"{len(toks):>8} {tok_before / len(toks):>13.1f} {tok_after / len(toks):>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Latency of running short workflows through the daemon (warm program
+# cache) against a cold `python main.py --lean` per run:
+# python -m bench.daemon_bench [--runs N] [files...]
+import argparse
+import glob
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from daemon import Client, Daemon
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(times):
+    times = sorted(times)
+    return statistics.median(times), times[int(0.95 * (len(times) - 1))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Daemon vs cold process latency")
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args()
+    files = args.files or sorted(glob.glob(os.path.join(HERE, "demos", "*.mf")))
+    sock = os.path.join(tempfile.mkdtemp(), "miniflow.sock")
+    daemon = Daemon()
+    threading.Thread(target=daemon.serve_socket, args=(sock,), daemon=True).start()
+    while not os.path.exists(sock):
+        time.sleep(0.01)
+    client = Client(sock)
+    print(f"{'program':<36}{'cold p50':>10}{'p95':>8}{'daemon 1st':>12}{'p50':>8}{'p95':>8}  (ms)")
+    for path in files:
+        cold = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, os.path.join(HERE, "main.py"), "--lean", path],
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        first = client.run(path=path)
+        first_time = time.perf_counter() - start
+        assert first["status"] == "ok", first
+        warm = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            client.run(path=path)
+            warm.append(time.perf_counter() - start)
+        c50, c95 = percentiles(cold)
+        w50, w95 = percentiles(warm)
+        print(
+            f"{os.path.basename(path):<36}{c50 * 1000:>10.1f}{c95 * 1000:>8.1f}"
+            f"{first_time * 1000:>12.2f}{w50 * 1000:>8.2f}{w95 * 1000:>8.2f}"
+        )
+    stats = client.stats()
+    print(f"program cache: {stats['hits']} hits, {stats['misses']} misses")
+    client.close()
+    daemon.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Dispatches and run time of nested-loop workflows with and without the
+# fused superinstructions: python -m bench.dispatch_bench [files...]
+import argparse
+
+from bench.opt_bench import best_of, executed
+from codegen import link, run_tac
+from ir import IRGen
+from optimizer import optimize
+from parser import parse_code
+from semantic import check_program
+
+WORKFLOWS = {
+    "nested loops": """
+x = 0
+y = 0
+repeat 300 times {
+  repeat 200 times {
+    repeat 5 times {
+      x = x + 1
+      y = y + x
+    }
+  }
+}
+print x
+print y
+""",
+    "loop with branches": """
+x = 0
+y = 0
+z = 0
+repeat 300 times {
+  repeat 200 times {
+    x = x + 1
+    if x > 30000 then {
+      y = y + 1
+    }
+    if x < 100 then {
+      z = z + x
+    }
+  }
+}
+print x
+print y
+print z
+""",
+    "counting down": """
+n = 60000
+s = 0
+repeat 60000 times {
+  if n != 0 then {
+    s = s + n
+  }
+  n = n - 1
+}
+print s
+""",
+}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Superinstruction effect on dispatch")
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    programs = list(WORKFLOWS.items())
+    for path in args.files:
+        with open(path) as f:
+            programs.append((path, f.read()))
+    print(f"{'program':<24}{'dispatches':>22}{'run(ms)':>22}")
+    for name, code in programs:
+        prog = parse_code(code)
+        st, diagnostics = check_program(prog)
+        tac, removed = optimize(IRGen().generate(prog))
+        plain, fused = link(tac, st, fused=False), link(tac, st)
+        assert run_tac(plain) == run_tac(fused), name
+        n0, n1 = executed(plain), executed(fused)
+        t0 = best_of(run_tac, plain, repeat=args.repeat)
+        t1 = best_of(run_tac, fused, repeat=args.repeat)
+        print(
+            f"{name:<24}{n0:>10} ->{n1:>9}{t0 * 1000:>10.1f} ->{t1 * 1000:>8.1f}"
+            f"  ({1 - n1 / n0:.0%} fewer dispatches, {1 - t1 / t0:.0%} faster)"
+        )
+
+
+if __name__ == "__main__":
+    main()
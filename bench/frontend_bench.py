@@ -0,0 +1,88 @@
+# Front end on large generated programs, phase by phase:
+# python -m bench.frontend_bench [--lines N] [--repeat R]
+import argparse
+import random
+import time
+
+from ir import IRGen
+from main import format_node, simple_ast
+from parser import parse_code
+from semantic import check_program
+
+OPS = ["+", "-", "*", "/", "==", "!=", "<", ">", "<=", ">=", "and", "or"]
+
+
+def expr(rnd, names, size):
+    parts = [rnd.choice(names) if rnd.random() < 0.6 else str(rnd.randrange(100))]
+    for _ in range(size):
+        parts += [rnd.choice(OPS[:4]), rnd.choice(names)]
+    return " ".join(parts)
+
+
+def program(lines, seed=1):
+    rnd = random.Random(seed)
+    names = [f"v{i}" for i in range(40)]
+    out = [f"{v} = {i}" for i, v in enumerate(names)]
+    depth = 0
+    while len(out) < lines:
+        r = rnd.random()
+        pad = "  " * depth
+        if r < 0.04:
+            out.append(f"step s{len(out)}")
+        elif r < 0.10 and depth < 6:
+            out.append(pad + f"repeat {rnd.randrange(1, 5)} times {{")
+            depth += 1
+        elif r < 0.18 and depth < 6:
+            # no operator precedence: `a < b + c` would compare first
+            cond = f"{expr(rnd, names, 1)} {rnd.choice(OPS[4:10])} {rnd.choice(names)}"
+            out.append(pad + f"if {cond} then {{")
+            depth += 1
+        elif r < 0.28 and depth:
+            depth -= 1
+            out.append("  " * depth + "}")
+        elif r < 0.40:
+            out.append(pad + f'print "line {len(out)}"' if r < 0.33 else pad + f"print {expr(rnd, names, 2)}")
+        else:
+            out.append(pad + f"{rnd.choice(names)} = {expr(rnd, names, rnd.randrange(0, 6))}")
+    out += ["}"] * depth
+    return "\n".join(out) + "\n"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Front end phases on large programs")
+    ap.add_argument("--lines", type=int, nargs="+", default=[20000, 200000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    names = ["parse", "check", "irgen", "format", "simple"]
+    print(f"{'lines':<10}" + "".join(f"{n:>9}" for n in names) + f"{'total':>9}")
+    for n in args.lines:
+        code = program(n)
+        best = {}
+        for _ in range(args.repeat):
+            times = {}
+            start = time.perf_counter()
+            prog = parse_code(code)
+            times["parse"] = time.perf_counter() - start
+            start = time.perf_counter()
+            check_program(prog)
+            times["check"] = time.perf_counter() - start
+            start = time.perf_counter()
+            IRGen().generate(prog)
+            times["irgen"] = time.perf_counter() - start
+            start = time.perf_counter()
+            format_node(prog)
+            times["format"] = time.perf_counter() - start
+            start = time.perf_counter()
+            simple_ast(prog)
+            times["simple"] = time.perf_counter() - start
+            for k, v in times.items():
+                best[k] = min(best.get(k, v), v)
+        print(
+            f"{n:<10}"
+            + "".join(f"{best[k]:>9.3f}" for k in names)
+            + f"{sum(best.values()):>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Recompile latency after editing one step of a large workflow, whole
+# program vs incremental: python -m bench.incremental_bench [--steps N]
+import argparse
+import time
+
+from codegen import link
+from incremental import IncrementalCompiler
+from ir import IRGen
+from optimizer import optimize
+from parser import parse_code
+from semantic import check_program
+
+
+def workflow(steps):
+    # `steps` steps of 10 lines each, chained by gotos
+    lines = ["total = 0"]
+    for i in range(steps):
+        lines += [
+            f"step s{i}",
+            f"x{i % 50} = total + {i}",
+            "repeat 3 times {",
+            f"  total = total + x{i % 50}",
+            "}",
+            f"if total > {i * 7} then {{",
+            '  print "big"',
+            "}",
+            "print total",
+            f"goto s{i + 1}" if i + 1 < steps else "print 0",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def whole(code):
+    prog = parse_code(code)
+    st, diagnostics = check_program(prog)
+    tac, removed = optimize(IRGen().generate(prog))
+    return link(tac, st)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Incremental recompile latency")
+    ap.add_argument("--steps", type=int, default=5000)
+    args = ap.parse_args()
+    code = workflow(args.steps)
+    edited = code.replace(
+        f"step s{args.steps // 2}\n", f"step s{args.steps // 2}\nprint 42\n"
+    )
+    inc = IncrementalCompiler()
+
+    def incremental(code):
+        prog, st, diagnostics, tac, opt, removed = inc.compile(code)
+        return link(opt, st)
+
+    print(f"{code.count(chr(10))} lines, {args.steps} steps")
+    print(f"whole program          {timed(whole, code) * 1000:>9.1f} ms")
+    print(f"incremental, cold      {timed(incremental, code) * 1000:>9.1f} ms")
+    t = timed(incremental, edited)
+    print(f"incremental, one edit  {t * 1000:>9.1f} ms ({inc.rebuilt}/{inc.total} units rebuilt)")
+    t = timed(incremental, "\n" + edited)
+    print(f"  ... lines shifted    {t * 1000:>9.1f} ms ({inc.rebuilt}/{inc.total} units rebuilt)")
+    print(f"whole program, edited  {timed(whole, edited) * 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
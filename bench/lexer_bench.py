@@ -0,0 +1,115 @@
+# Compare lexer.iter_tokens with the original one-match-per-token regex loop
+import argparse
+import io
+import random
+import time
+
+from lexer import KEYWORDS, Token, get_token, iter_tokens, tokenize
+
+
+def reference_tokenize(code):
+    # the tokenizer as it was before the fast scanner, kept as the baseline
+    mo = get_token(code)
+    index = 0
+    tokens = []
+    cur_line = 1
+    cur_col = 1
+    while mo is not None:
+        typ = mo.lastgroup
+        val = mo.group(typ)
+        if typ == "NEWLINE":
+            tokens.append(Token("NEWLINE", "\n", cur_line, cur_col))
+            cur_line += 1
+            cur_col = 1
+        elif typ == "SKIP" or typ == "COMMENT":
+            pass
+        elif typ == "MISMATCH":
+            raise SyntaxError(
+                f"Unexpected character {val!r} at line {cur_line} col {cur_col}"
+            )
+        else:
+            if typ == "ID" and val in KEYWORDS:
+                typ = val.upper()
+            tokens.append(Token(typ, val, cur_line, cur_col))
+            cur_col += len(val)
+        index = mo.end()
+        mo = get_token(code, index)
+    tokens.append(Token("EOF", "", cur_line, cur_col))
+    return tokens
+
+
+def synthetic(lines, seed=0, indent="    ", comments=True):
+    rnd = random.Random(seed)
+    names = [f"var_{i}" for i in range(50)]
+    out = []
+    depth = 0
+    for i in range(lines):
+        pad = indent * depth
+        k = rnd.random()
+        if k < 0.05:
+            out.append(f"step s{i}")
+        elif k < 0.1 and depth < 8:
+            out.append(f"{pad}repeat {rnd.randint(1, 9)} times {{")
+            depth += 1
+        elif k < 0.15 and depth < 8:
+            a, b = rnd.sample(names, 2)
+            out.append(f"{pad}if {a} >= {b} and {a} != 0 then {{")
+            depth += 1
+        elif k < 0.25 and depth:
+            out.append(indent * (depth - 1) + "}")
+            depth -= 1
+        elif k < 0.4:
+            out.append(f'{pad}print "message number {i}"')
+        else:
+            a, b, c = rnd.sample(names, 3)
+            line = f"{pad}{a} = {b} + {rnd.randint(0, 999)} * {c} - 7"
+            if comments and k > 0.9:
+                line += "   # update"
+            out.append(line)
+    out.extend(indent * d + "}" for d in range(depth - 1, -1, -1))
+    return "\n".join(out) + "\n"
+
+
+def best_of(fn, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def drain(code):
+    # streaming use: tokens pulled from a file object and dropped
+    for _ in iter_tokens(io.StringIO(code)):
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Lexer throughput benchmark")
+    ap.add_argument("--lines", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    print(
+        f"{'lines':>8} {'tokens':>9} {'reference':>10} {'tokenize':>10} "
+        f"{'speedup':>8} {'stream':>10}"
+    )
+    for n in args.lines:
+        code = synthetic(n)
+        ref = reference_tokenize(code)
+        fast = tokenize(code)
+        assert [(t.type, t.value, t.line, t.col) for t in ref] == [
+            (t.type, t.value, t.line, t.col) for t in fast
+        ], "token streams differ"
+        t_ref = best_of(reference_tokenize, code, args.repeat)
+        t_fast = best_of(tokenize, code, args.repeat)
+        t_stream = best_of(drain, code, args.repeat)
+        print(
+            f"{n:>8} {len(ref):>9} {t_ref:>9.3f}s {t_fast:>9.3f}s "
+            f"{t_ref / t_fast:>7.2f}x {t_stream:>9.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
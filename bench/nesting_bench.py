@@ -0,0 +1,70 @@
+# Stress the front end with deeply nested repeat/if blocks and long
+# operator chains; every phase must stay linear and recursion-free
+import argparse
+import time
+
+from ir import IRGen
+from main import simple_ast
+from optimizer import optimize
+from parser import parse_code
+from semantic import check_program
+from codegen import link, run_tac
+
+
+def nested(depth):
+    # alternating repeat/if blocks, depth levels deep
+    lines = ["x = 1"]
+    for i in range(depth):
+        lines.append("repeat 1 times {" if i % 2 == 0 else "if x > 0 then {")
+    lines.append("print x")
+    lines.extend("}" for _ in range(depth))
+    return "\n".join(lines) + "\n"
+
+
+def chain(length):
+    # one expression with `length` operators: a left-leaning tree that deep
+    return "x = 1\ny = " + " + ".join(["x"] * (length + 1)) + "\nprint y\n"
+
+
+def phases(code, with_print=True):
+    times = {}
+
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        res = fn(*args)
+        times[name] = time.perf_counter() - start
+        return res
+
+    prog = timed("parse", parse_code, code)
+    st, diagnostics = timed("check", check_program, prog)
+    tac = timed("irgen", IRGen().generate, prog)
+    tac3, removed = timed("opt", optimize, tac)
+    linked = timed("link", link, tac3, st)
+    out = timed("run", run_tac, linked)
+    if with_print:
+        timed("print", simple_ast, prog)
+    assert not diagnostics, diagnostics
+    return times, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Deep nesting stress benchmark")
+    ap.add_argument(
+        "--depths", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    # simple_ast indents every level, so its *output* grows with depth**2
+    ap.add_argument("--print-max", type=int, default=10000)
+    args = ap.parse_args()
+    names = ["parse", "check", "irgen", "opt", "link", "run", "print"]
+    print(f"{'program':<14}" + "".join(f"{n:>8}" for n in names) + f"{'total':>9}")
+    for kind, make in (("nested", nested), ("chain", chain)):
+        for d in args.depths:
+            times, out = phases(make(d), kind == "chain" or d <= args.print_max)
+            assert out == [str(d + 1 if kind == "chain" else 1)], out
+            row = f"{kind + ' ' + str(d):<14}"
+            row += "".join(f"{times[n]:>8.3f}" if n in times else f"{'-':>8}" for n in names)
+            print(row + f"{sum(times.values()):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Executed instructions and run time of the demos before and after the
+# optimizer: python -m bench.opt_bench [files...]
+import argparse
+import glob
+import os
+import time
+
+from codegen import execute, link, run_tac
+from ir import IRGen
+from optimizer import optimize
+from parser import parse_code
+from semantic import check_program
+
+
+def executed(linked):
+    # instructions a run dispatches (State.executed), output discarded
+    return execute(linked, _discard).executed
+
+
+def _discard(line):
+    pass
+
+
+def best_of(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ap = argparse.ArgumentParser(description="Optimizer effect on executed instructions")
+    ap.add_argument("files", nargs="*")
+    args = ap.parse_args()
+    files = args.files or sorted(glob.glob(os.path.join(here, "demos", "*.mf")))
+    print(f"{'program':<36}{'static':>13}{'executed':>15}{'run(ms)':>17}")
+    total = [0, 0]
+    for path in files:
+        with open(path) as f:
+            prog = parse_code(f.read())
+        st, diagnostics = check_program(prog)
+        tac = IRGen().generate(prog)
+        opt, removed = optimize(tac)
+        before, after = link(tac, st), link(opt, st)
+        assert run_tac(before) == run_tac(after), path
+        n0, n1 = executed(before), executed(after)
+        total[0] += n0
+        total[1] += n1
+        t0, t1 = best_of(run_tac, before), best_of(run_tac, after)
+        print(
+            f"{os.path.basename(path):<36}{len(before):>6} ->{len(after):>4}"
+            f"{n0:>8} ->{n1:>5}{t0 * 1000:>9.3f} ->{t1 * 1000:>6.3f}"
+        )
+    print(f"executed instructions: {total[0]} -> {total[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Front end of large generated programs, serial against frontend.FrontEnd
+# over different numbers of worker processes, checking that the AST, symbol
+# table, diagnostics and TAC are those of the serial compile:
+# python -m bench.parallel_frontend_bench [--lines N] [--jobs J...] [--lean]
+import argparse
+import functools
+import os
+import time
+
+from bench.frontend_bench import program
+from frontend import FrontEnd, compile_serial
+from main import format_node
+
+
+def result(compiled):
+    prog, st, diagnostics, tac = compiled
+    return (
+        format_node(prog) if prog is not None else None,
+        list(st.items()),
+        st.value_types(),
+        diagnostics,
+        [(repr(instr), instr.src) for instr in tac],
+    )
+
+
+def best_of(fn, code, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(code)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Parallel front end on large programs")
+    ap.add_argument("--lines", type=int, nargs="+", default=[20000, 200000])
+    ap.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument(
+        "--lean", action="store_true", help="without the AST, as main.py --lean"
+    )
+    args = ap.parse_args()
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'lines':<10}{'serial':>9}" + "".join(f"{f'-j {j}':>16}" for j in args.jobs))
+    for n in args.lines:
+        code = program(n)
+        serial_compile = functools.partial(compile_serial, ast=not args.lean)
+        expected = result(serial_compile(code))
+        serial = best_of(serial_compile, code, args.repeat)
+        row = f"{n:<10}{serial:>9.3f}"
+        for jobs in args.jobs:
+            with FrontEnd(jobs) as fe:
+                compile = functools.partial(fe.compile, ast=not args.lean)
+                assert result(compile(code)) == expected, f"-j {jobs} differs"
+                t = best_of(compile, code, args.repeat)
+            row += f"{t:>9.3f} ({serial / t:.2f}x)"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# Time every phase of compile_and_run on the synthetic workloads (and any
+# .mf files given), write the results as JSON and compare them with a
+# stored baseline:
+#   python -m bench.phase_bench --json base.json          # record
+#   python -m bench.phase_bench --baseline base.json      # compare
+# Exits with status 1 when a phase got slower than the threshold allows.
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+from bench.workloads import suite
+from codegen import link, run_tac
+from ir import IRGen
+from lexer import tokenize
+from optimizer import optimize, pass_timer
+from parser import Parser
+from semantic import check_program
+from sinks import CallbackSink
+
+PHASES = [
+    "tokenize",
+    "parse",
+    "check",
+    "irgen",
+    "coalesce",
+    "loops",
+    "fold",
+    "dce",
+    "link",
+    "run",
+]
+
+
+def _discard(line):
+    pass
+
+
+def phases(code):
+    # {phase: seconds} for one compile and run of code
+    times = {}
+
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        res = fn(*args)
+        times[name] = time.perf_counter() - start
+        return res
+
+    tokens = timed("tokenize", tokenize, code)
+    prog = timed("parse", Parser(tokens).parse)
+    st, diagnostics = timed("check", check_program, prog)
+    tac = timed("irgen", IRGen(types=st.value_types()).generate, prog)
+    opt, removed = optimize(tac, run_pass=pass_timer(times))
+    linked = timed("link", link, opt, st)
+    timed("run", run_tac, linked, CallbackSink(_discard))
+    return times
+
+
+def measure(programs, repeat):
+    # {name: {"lines", "phases", "total"}}, best of `repeat` runs per phase
+    results = {}
+    for name, code in programs.items():
+        best = {}
+        for _ in range(repeat):
+            gc.collect()
+            for k, v in phases(code).items():
+                best[k] = min(best.get(k, v), v)
+        results[name] = {
+            "lines": code.count("\n"),
+            "phases": best,
+            "total": sum(best.values()),
+        }
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    # [(workload, phase, base, now)] for phases slower than base by more
+    # than the threshold (a fraction) and by at least min_delta seconds
+    slower = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        rows = list(res["phases"].items()) + [("total", res["total"])]
+        for phase, now in rows:
+            was = base["total"] if phase == "total" else base["phases"].get(phase)
+            if was is None:
+                continue
+            if now > was * (1 + threshold) and now - was >= min_delta:
+                slower.append((name, phase, was, now))
+    return slower
+
+
+def table(results, baseline=None):
+    lines = [f"{'workload':<12}{'lines':>8}" + "".join(f"{p:>10}" for p in PHASES) + f"{'total':>10}"]
+    for name, res in results.items():
+        cells = [res["phases"].get(p, 0.0) * 1000 for p in PHASES] + [res["total"] * 1000]
+        lines.append(f"{name:<12}{res['lines']:>8}" + "".join(f"{c:>10.2f}" for c in cells))
+        base = (baseline or {}).get(name)
+        if base is not None:
+            was = [base["phases"].get(p) for p in PHASES] + [base["total"]]
+            ratio = [f"{now / (1000 * w):>9.2f}x" if w else f"{'-':>10}" for now, w in zip(cells, was)]
+            lines.append(f"{'  vs base':<20}" + "".join(ratio))
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-phase compiler benchmark")
+    ap.add_argument("files", nargs="*", help="extra .mf programs to time")
+    ap.add_argument("--scale", type=float, default=1.0, help="workload size factor")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", nargs="+", help="workloads to run (by name)")
+    ap.add_argument("--json", help="write the results to this file")
+    ap.add_argument("--baseline", help="results JSON to compare against")
+    ap.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="allowed slowdown per phase, as a fraction (default 0.15)",
+    )
+    ap.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.002,
+        help="ignore slowdowns below this many seconds (timer noise)",
+    )
+    args = ap.parse_args()
+    programs = suite(args.scale)
+    if args.only:
+        programs = {k: v for k, v in programs.items() if k in args.only}
+    for path in args.files:
+        with open(path) as f:
+            programs[os.path.basename(path)] = f.read()
+    results = measure(programs, args.repeat)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["workloads"]
+    print("best of", args.repeat, "runs, ms")
+    print(table(results, baseline))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "scale": args.scale,
+                    "repeat": args.repeat,
+                    "workloads": results,
+                },
+                f,
+                indent=2,
+            )
+    if baseline is not None:
+        slower = compare(results, baseline, args.threshold, args.min_delta)
+        for name, phase, was, now in slower:
+            print(
+                f"REGRESSION {name}/{phase}: {was * 1000:.2f} -> {now * 1000:.2f} ms"
+                f" ({now / was:.2f}x)"
+            )
+        if slower:
+            sys.exit(1)
+        print(f"no phase slower than {args.threshold:.0%} over the baseline")
+
+
+if __name__ == "__main__":
+    main()
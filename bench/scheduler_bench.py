@@ -0,0 +1,108 @@
+# Many workflow instances over one compiled program: throughput of the
+# round-robin scheduler against running instances one after the other, and
+# how long short instances wait behind long ones:
+# python -m bench.scheduler_bench [--instances N] [--quantum Q]
+import argparse
+import time
+
+from codegen import link, run_tac
+from ir import IRGen
+from optimizer import optimize
+from parser import parse_code
+from scheduler import Scheduler
+from semantic import check_program
+from sinks import CallbackSink
+
+
+def workflow(iterations):
+    # a few steps with a loop, branches and output; `iterations` sets length
+    return "\n".join(
+        [
+            "step fetch",
+            "n = 0",
+            "total = 0",
+            f"repeat {iterations} times {{",
+            "  n = n + 1",
+            "  if n > 3 then {",
+            "    total = total + n",
+            "  }",
+            "}",
+            "step report",
+            "print total",
+            "if total > 100 then {",
+            "  goto done",
+            "}",
+            'print "small"',
+            "step done",
+            "print n",
+        ]
+    ) + "\n"
+
+
+def compiled(code):
+    prog = parse_code(code)
+    st, diagnostics = check_program(prog)
+    tac, removed = optimize(IRGen().generate(prog))
+    return link(tac, st)
+
+
+def _discard(line):
+    pass
+
+
+def throughput(linked, instances, quantum):
+    start = time.perf_counter()
+    for _ in range(instances):
+        run_tac(linked, CallbackSink(_discard))
+    sequential = time.perf_counter() - start
+    sched = Scheduler(linked, quantum)
+    for _ in range(instances):
+        sched.spawn(CallbackSink(_discard))
+    start = time.perf_counter()
+    done = sched.run()
+    scheduled = time.perf_counter() - start
+    assert all(inst.status == "done" for inst in done)
+    slices = sum(inst.slices for inst in done)
+    return sequential, scheduled, slices
+
+
+def latencies(long, short, n_long, n_short, quantum):
+    # completion time of every short instance, spawned after the long ones
+    sched = Scheduler(short, quantum)
+    for _ in range(n_long):
+        sched.spawn(CallbackSink(_discard), long)
+    shorts = {sched.spawn(CallbackSink(_discard)).id for _ in range(n_short)}
+    finished = {}
+    start = time.perf_counter()
+    while sched.ready:
+        inst = sched.step()
+        if inst.status != "ready" and inst.id in shorts:
+            finished[inst.id] = time.perf_counter() - start
+    total = time.perf_counter() - start
+    times = sorted(finished.values())
+    return times[len(times) // 2], times[int(0.99 * (len(times) - 1))], total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Workflow instance scheduler")
+    ap.add_argument("--instances", type=int, default=5000)
+    ap.add_argument("--quantum", type=int, default=1024)
+    args = ap.parse_args()
+    linked = compiled(workflow(1000))
+    sequential, scheduled, slices = throughput(linked, args.instances, args.quantum)
+    print(f"throughput, {args.instances} instances of a 1000-iteration workflow")
+    print(f"  one after another   {args.instances / sequential:>10.0f} instances/s")
+    print(
+        f"  scheduled (q={args.quantum:<4})  {args.instances / scheduled:>10.0f} instances/s"
+        f"  ({slices} slices, {scheduled / sequential - 1:+.1%} time)"
+    )
+    long, short = compiled(workflow(200000)), compiled(workflow(20))
+    print("fairness: 20 long (200k iterations) then 2000 short (20) instances")
+    print(f"  {'':<20}{'short p50':>11}{'short p99':>11}{'all done':>10}  (ms)")
+    for name, quantum in (("run to completion", -1), (f"round robin q={args.quantum}", args.quantum)):
+        p50, p99, total = latencies(long, short, 20, 2000, quantum)
+        print(f"  {name:<20}{p50 * 1000:>11.1f}{p99 * 1000:>11.1f}{total * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
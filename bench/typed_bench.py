@@ -0,0 +1,89 @@
+# Run time of arithmetic-heavy workflows with generic binops (operands
+# coerced with int()) against the typed ones IRGen emits from the semantic
+# value types: python -m bench.typed_bench [files...]
+import argparse
+
+from bench.dispatch_bench import WORKFLOWS
+from bench.opt_bench import best_of
+from codegen import link, run_tac
+from ir import IRGen
+from optimizer import optimize
+from parser import parse_code
+from pybackend import build
+from semantic import check_program
+
+ARITHMETIC = {
+    "arithmetic": """
+a = 1
+b = 7
+c = 0
+repeat 400 times {
+  repeat 250 times {
+    a = a * 3 + b
+    a = a - a / 1000 * 1000
+    b = b + a / 7 - c
+    c = c + 1
+    if a > b then {
+      c = c - a / 100
+    }
+  }
+}
+print a
+print b
+print c
+""",
+    "comparisons": """
+x = 0
+hits = 0
+repeat 500 times {
+  repeat 200 times {
+    x = x + 7
+    x = x - x / 1000 * 1000
+    if x > 500 and x < 900 then {
+      hits = hits + 1
+    }
+    if x == 0 or x >= 990 then {
+      hits = hits - 1
+    }
+  }
+}
+print hits
+""",
+}
+
+
+def compiled(prog, types):
+    tac, removed = optimize(IRGen(types=types).generate(prog))
+    return tac
+
+
+def _discard(line):
+    pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Typed binops against generic ones")
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    programs = list(ARITHMETIC.items()) + list(WORKFLOWS.items())
+    for path in args.files:
+        with open(path) as f:
+            programs.append((path, f.read()))
+    print(f"{'program':<24}{'tac generic/typed (ms)':>26}{'pyc generic/typed (ms)':>26}")
+    for name, code in programs:
+        prog = parse_code(code)
+        st, diagnostics = check_program(prog)
+        generic = link(compiled(prog, None), st)
+        typed = link(compiled(prog, st.value_types()), st)
+        assert run_tac(generic) == run_tac(typed), name
+        row = f"{name:<24}"
+        for run in (run_tac, lambda linked: build(linked)(_discard)):
+            t0 = best_of(run, generic, repeat=args.repeat)
+            t1 = best_of(run, typed, repeat=args.repeat)
+            row += f"{t0 * 1000:>9.1f} ->{t1 * 1000:>7.1f} ({t0 / t1:.2f}x)"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Synthetic MiniFlow workflows for benchmarking, each shape scaled by one
+# size parameter. Every program terminates and keeps its values small, so
+# the whole pipeline including the run can be timed.
+# python -m bench.workloads --out DIR [--scale S] writes them as .mf files.
+import argparse
+import os
+import random
+
+
+def many_steps(size, seed=0):
+    # `size` steps chained by gotos, each with a small loop and a branch
+    rnd = random.Random(seed)
+    lines = ["total = 0", "x = 0"]
+    for i in range(size):
+        lines += [
+            f"step s{i}",
+            f"x = total + {rnd.randrange(10)}",
+            f"repeat {rnd.randrange(1, 4)} times {{",
+            "  total = total + 1",
+            "}",
+            f"if x > {rnd.randrange(size + 1)} then {{",
+            "  total = total - 1",
+            "}",
+            "print total",
+            f"goto s{i + 1}" if i + 1 < size else "print x",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def deep_nesting(size, seed=0, depth=12):
+    # `size` blocks of alternating repeat/if nests, `depth` levels each
+    rnd = random.Random(seed)
+    names = [f"n{i}" for i in range(8)]
+    lines = [f"{v} = {i}" for i, v in enumerate(names)]
+    for _ in range(size):
+        for level in range(depth):
+            pad = "  " * level
+            if level % 3 == 0:
+                lines.append(pad + "repeat 2 times {")
+            else:
+                lines.append(pad + f"if {rnd.choice(names)} < {rnd.randrange(50, 100)} then {{")
+        pad = "  " * depth
+        for _ in range(4):
+            a, b = rnd.sample(names, 2)
+            lines.append(pad + f"{a} = {b} + {rnd.randrange(1, 5)} - {rnd.randrange(1, 5)}")
+        v = rnd.choice(names)
+        lines += [pad + f"if {v} > 40 then {{", pad + f"  {v} = {v} - 40", pad + "}"]
+        for level in reversed(range(depth)):
+            lines.append("  " * level + "}")
+    lines.append("print " + " + ".join(names))
+    return "\n".join(lines) + "\n"
+
+
+def straight_line(size, seed=0):
+    # `size` lines of arithmetic without control flow; every assignment
+    # reads one variable so values grow at most linearly
+    rnd = random.Random(seed)
+    names = [f"a{i}" for i in range(32)]
+    lines = [f"{v} = {i}" for i, v in enumerate(names)]
+    for i in range(size):
+        dest, src = rnd.choice(names), rnd.choice(names)
+        r = rnd.random()
+        if r < 0.6:
+            terms = [f"{rnd.choice('+-')} {rnd.randrange(1, 10)}" for _ in range(rnd.randrange(1, 6))]
+            lines.append(f"{dest} = {src} " + " ".join(terms))
+        elif r < 0.8:
+            lines.append(f"{dest} = {src} * 2 - {src}")
+        elif r < 0.9:
+            lines.append(f"print {src} {rnd.choice(['<', '>', '==', '!=', '<=', '>='])} {dest}")
+        else:
+            lines.append(f"print {src}")
+    return "\n".join(lines) + "\n"
+
+
+def state_machine(size, seed=0, states=32):
+    # goto-heavy: `states` steps jumping around until `size` transitions ran
+    rnd = random.Random(seed)
+    lines = [f"left = {size}", "x = 0", "goto q0"]
+    for i in range(states):
+        lines += [
+            f"step q{i}",
+            "left = left - 1",
+            "if left < 1 then {",
+            "  goto done",
+            "}",
+            f"x = x + {rnd.randrange(1, 20)}",
+            "if x > 100 then {",
+            "  x = x - 100",
+            f"  goto q{rnd.randrange(states)}",
+            "}",
+            f"goto q{(i + 1) % states}",
+        ]
+    lines += ["step done", "print x"]
+    return "\n".join(lines) + "\n"
+
+
+def print_loop(size, seed=0):
+    # `size` iterations printing a few lines each
+    return "\n".join(
+        [
+            "i = 0",
+            f"repeat {size} times {{",
+            "  i = i + 1",
+            "  print i",
+            '  print "row"',
+            "  if i > 10 then {",
+            "    print i - 10",
+            "  }",
+            "}",
+            "print i",
+        ]
+    ) + "\n"
+
+
+GENERATORS = {
+    "steps": many_steps,
+    "nesting": deep_nesting,
+    "straight": straight_line,
+    "fsm": state_machine,
+    "prints": print_loop,
+}
+# default sizes for --scale 1, chosen so every workload takes tens of ms
+SIZES = {
+    "steps": 2000,
+    "nesting": 100,
+    "straight": 20000,
+    "fsm": 500000,
+    "prints": 200000,
+}
+
+
+def suite(scale=1.0, seed=0):
+    # {name: program text} for every shape at the given scale
+    return {
+        name: gen(max(1, int(SIZES[name] * scale)), seed)
+        for name, gen in GENERATORS.items()
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write synthetic .mf workflows")
+    ap.add_argument("--out", required=True, help="directory to write into")
+    ap.add_argument("--scale", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    for name, code in suite(args.scale, args.seed).items():
+        path = os.path.join(args.out, f"{name}.mf")
+        with open(path, "w") as f:
+            f.write(code)
+        print(f"{path}: {code.count(chr(10))} lines")
+
+
+if __name__ == "__main__":
+    main()
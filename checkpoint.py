@@ -0,0 +1,157 @@
+# Checkpoint and resume of running workflows. A checkpoint directory holds
+#   program.mfc   the optimized module (mfc format), written once per run
+#   state.ckpt    the latest execution state, replaced atomically
+# The state names the program by the SHA-256 of program.mfc, so resuming
+# needs neither the source nor a recompile (only a link), and a state is
+# never applied to a different program.
+#
+# state.ckpt layout (little endian):
+#   header   magic "MFK", format version u8, program hash (32 bytes)
+#   pc u64, output lines emitted so far u64
+#   frame    u32 count, then per variable/temp slot: slot u32, tagged value
+#            (mfc.encode_value)
+import hashlib
+import os
+import struct
+import time
+
+from codegen import CONST, State, execute
+from mfc import FormatError, U32, compiler_version, decode_value, dumps, encode_value, loads
+
+MAGIC = b"MFK"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<3sB32s")
+POSITION = struct.Struct("<QQ")
+PROGRAM = "program.mfc"
+STATE = "state.ckpt"
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpointer:
+    # every: instructions between checks; interval: least seconds between two
+    # checkpoints. A check costs one execute() call, a checkpoint one small
+    # fsync'd write, so both bound the overhead. at_steps: once a checkpoint
+    # is due, keep running one instruction at a time (at most `every` more)
+    # until control reaches a step label, and take it there.
+    def __init__(self, directory, every=100000, interval=1.0, at_steps=False):
+        self.directory = directory
+        self.every = every
+        self.interval = interval
+        self.at_steps = at_steps
+        self.program_hash = None
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def start(self, mod):
+        # a fresh run of module `mod`: store it and drop any older state
+        data = dumps(mod, compiler_version())
+        _write_atomic(self.path(PROGRAM), data)
+        self.program_hash = hashlib.sha256(data).digest()
+        if os.path.exists(self.path(STATE)):
+            os.remove(self.path(STATE))
+
+    def load(self):
+        # -> (module, state dict or None) of the run in the directory
+        try:
+            with open(self.path(PROGRAM), "rb") as f:
+                data = f.read()
+        except OSError as e:
+            raise CheckpointError(f"No checkpointed program in {self.directory}: {e}")
+        try:
+            mod = loads(data, compiler_version())
+        except FormatError as e:
+            raise CheckpointError(f"Cannot resume {self.directory}: {e}")
+        self.program_hash = hashlib.sha256(data).digest()
+        try:
+            with open(self.path(STATE), "rb") as f:
+                buf = f.read()
+        except FileNotFoundError:
+            return mod, None
+        try:
+            magic, fmt, program = HEADER.unpack_from(buf, 0)
+            if magic != MAGIC or fmt != FORMAT_VERSION:
+                raise CheckpointError(f"{self.path(STATE)} is not a checkpoint")
+            if program != self.program_hash:
+                raise CheckpointError(f"{self.path(STATE)} belongs to another program")
+            pc, lines = POSITION.unpack_from(buf, HEADER.size)
+            off = HEADER.size + POSITION.size
+            (n,) = U32.unpack_from(buf, off)
+            off += 4
+            frame = {}
+            for _ in range(n):
+                (slot,) = U32.unpack_from(buf, off)
+                frame[slot], off = decode_value(buf, off + 4)
+        except (struct.error, IndexError, KeyError, UnicodeDecodeError) as e:
+            raise CheckpointError(f"Corrupt checkpoint: {e}")
+        return mod, {"pc": pc, "lines": lines, "frame": frame}
+
+    def save(self, linked, state, lines):
+        kinds = linked.kinds
+        frame = state.frame
+        slots = [i for i in range(len(frame)) if kinds[i] != CONST]
+        out = [
+            HEADER.pack(MAGIC, FORMAT_VERSION, self.program_hash),
+            POSITION.pack(state.pc, lines),
+            U32.pack(len(slots)),
+        ]
+        for i in slots:
+            out.append(U32.pack(i))
+            out.append(encode_value(frame[i]))
+        _write_atomic(self.path(STATE), b"".join(out))
+        self.written += 1
+
+    def run(self, linked, sink, st, saved=None):
+        # run linked (restored from `saved`, a load() state, if given; st
+        # names the steps), checkpointing as configured; the final state has
+        # pc at the end. The sink is flushed before every checkpoint so that
+        # what it wrote is never emitted again on resume.
+        state = State(linked)
+        lines = 0
+        if saved is not None:
+            state.pc = saved["pc"]
+            for slot, value in saved["frame"].items():
+                state.frame[slot] = value
+            lines = saved["lines"]
+        steps = {
+            pc for name, pc in linked.labels.items() if st.lookup(name) == "step"
+        }
+        n = len(linked.code)
+        counter = [lines]
+
+        def emit(line):
+            counter[0] += 1
+            sink.write(line)
+
+        last = time.monotonic()
+        while state.pc < n:
+            execute(linked, emit, state, self.every)
+            if state.pc >= n or time.monotonic() - last < self.interval:
+                continue
+            if self.at_steps:
+                for _ in range(self.every):
+                    if state.pc in steps or state.pc >= n:
+                        break
+                    execute(linked, emit, state, 1)
+            if hasattr(sink, "flush"):
+                sink.flush()
+            self.save(linked, state, counter[0])
+            last = time.monotonic()
+        if hasattr(sink, "flush"):
+            sink.flush()
+        self.save(linked, state, counter[0])
+        return sink.finish()
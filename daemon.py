@@ -0,0 +1,285 @@
+# Long-running workflow daemon: compiled programs stay in an in-memory LRU
+# keyed by source hash, so a trigger costs a request round trip plus the
+# run itself instead of interpreter start-up, imports and a compile.
+#
+# Requests and replies are JSON objects, one per line, over a Unix socket
+# (main.py --daemon --socket PATH) or stdin/stdout (main.py --daemon):
+#   {"id": 1, "source": "print 1\n"}   or   {"id": 2, "path": "flow.mf"}
+#   optional: "backend": "tac" | "pyc";   {"op": "stats"} for cache counters
+#   -> {"id": 1, "status": "ok", "output": [...], "diagnostics": [...],
+#       "error": null, "cached": false, "compile": s, "run": s}
+# Connections and stdin are served on an asyncio event loop; the runs go to
+# a thread pool (loop.run_in_executor), so requests run concurrently and
+# replies on one connection come back in completion order, matched up by
+# "id".
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ast import import_past_ast
+
+asyncio = import_past_ast("asyncio")
+
+from codegen import link, run_tac
+from main import compile_program
+from pybackend import build
+from sinks import ListSink
+
+
+class Program:
+    # one compiled workflow; `fn` is the pyc backend's function, built on
+    # first use
+    __slots__ = ("linked", "diagnostics", "fn")
+
+    def __init__(self, linked, diagnostics):
+        self.linked = linked
+        self.diagnostics = diagnostics
+        self.fn = None
+
+
+def compile_workflow(code):
+    prog, st, diagnostics, tac, removed = compile_program(code)
+    return Program(link(tac, st), diagnostics)
+
+
+class ProgramCache:
+    # least recently used compiled programs, at most max_entries of them
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.programs = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, code):
+        # -> (program, whether it was cached); compiles on a miss
+        key = hashlib.sha256(code.encode("utf-8")).digest()
+        with self.lock:
+            program = self.programs.get(key)
+            if program is not None:
+                self.programs.move_to_end(key)
+                self.hits += 1
+                return program, True
+            self.misses += 1
+        # compiled outside the lock; two threads racing on the same new
+        # source both compile it and the second result wins
+        program = compile_workflow(code)
+        with self.lock:
+            self.programs[key] = program
+            self.programs.move_to_end(key)
+            while len(self.programs) > self.max_entries:
+                self.programs.popitem(last=False)
+                self.evictions += 1
+        return program, False
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.programs),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _run(program, backend, sink):
+    if backend == "pyc":
+        if program.fn is None:
+            program.fn = build(program.linked)
+        program.fn(sink.write)
+    else:
+        run_tac(program.linked, sink)
+
+
+def handle(request, cache):
+    # one request dict -> one reply dict; never raises
+    reply = {"id": request.get("id")}
+    if request.get("op") == "stats":
+        reply.update(status="ok", stats=cache.stats())
+        return reply
+    reply.update(status="ok", output=[], diagnostics=[], error=None, cached=False)
+    sink = ListSink()
+    try:
+        backend = request.get("backend", "tac")
+        if backend not in ("tac", "pyc"):
+            raise ValueError(f"unknown backend {backend!r}")
+        code = request.get("source")
+        if code is None:
+            with open(request["path"]) as f:
+                code = f.read()
+        start = time.perf_counter()
+        program, reply["cached"] = cache.get(code)
+        reply["compile"] = time.perf_counter() - start
+        reply["diagnostics"] = program.diagnostics
+        if program.diagnostics:
+            reply["status"] = "diagnostics"
+        start = time.perf_counter()
+        try:
+            _run(program, backend, sink)
+        finally:
+            reply["run"] = time.perf_counter() - start
+            reply["output"] = sink.lines
+    except Exception as e:
+        reply.update(status="error", error=f"{type(e).__name__}: {e}")
+    return reply
+
+
+# longest request line read from a socket (asyncio's default is 64 KiB;
+# requests carry whole sources)
+LINE_LIMIT = 1 << 30
+
+
+class Daemon:
+    def __init__(self, workers=None, max_entries=256):
+        self.cache = ProgramCache(max_entries)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.loop = self.server = None
+
+    async def serve_lines(self, readline, write):
+        # read requests with `await readline()` until it returns an empty
+        # line and hand each reply line to `await write(text)`; returns once
+        # every reply has been written
+        loop = asyncio.get_running_loop()
+        pending = set()
+
+        async def reply(request):
+            result = await loop.run_in_executor(self.pool, handle, request, self.cache)
+            try:
+                await write(json.dumps(result) + "\n")
+            except ConnectionError:
+                pass  # the client went away; the run is done anyway
+
+        while True:
+            line = await readline()
+            if not line:
+                break
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                await write(json.dumps({"id": None, "status": "error", "error": f"bad request: {e}"}) + "\n")
+                continue
+            task = asyncio.create_task(reply(request))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    def serve_stdio(self):
+        asyncio.run(self._serve_stdio())
+
+    async def _serve_stdio(self):
+        # stdin may be a regular file, which the event loop cannot watch:
+        # its lines are read on the loop's default executor instead
+        loop = asyncio.get_running_loop()
+
+        async def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        await self.serve_lines(lambda: loop.run_in_executor(None, sys.stdin.readline), write)
+
+    def serve_socket(self, path):
+        asyncio.run(self._serve_socket(path))
+
+    async def _serve_socket(self, path):
+        async def connection(reader, writer):
+            lock = asyncio.Lock()
+
+            async def write(text):
+                async with lock:
+                    writer.write(text.encode("utf-8"))
+                    await writer.drain()
+
+            try:
+                await self.serve_lines(reader.readline, write)
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_unix_server(connection, path, limit=LINE_LIMIT)
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass  # shutdown() closed the server
+        finally:
+            self.server.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def shutdown(self):
+        # may be called from any thread
+        if self.server is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.server.close)
+        self.pool.shutdown()
+
+
+class Client:
+    # talks to a daemon listening on a Unix socket; one request at a time
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("rb")
+        self.next_id = 0
+
+    def request(self, **request):
+        self.next_id += 1
+        request["id"] = self.next_id
+        self.sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        return json.loads(self.rfile.readline())
+
+    def run(self, source=None, path=None, backend="tac"):
+        if source is None:
+            return self.request(path=os.path.abspath(path), backend=backend)
+        return self.request(source=source, backend=backend)
+
+    def stats(self):
+        return self.request(op="stats")["stats"]
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def main():
+    # client: python daemon.py --socket PATH [--backend B] files...
+    ap = argparse.ArgumentParser(description="Run workflows on a MiniFlow daemon")
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--socket", required=True, help="the daemon's Unix socket")
+    ap.add_argument("--backend", choices=["tac", "pyc"], default="tac")
+    ap.add_argument("--stats", action="store_true", help="print cache statistics")
+    args = ap.parse_args()
+    client = Client(args.socket)
+    failed = False
+    for path in args.files:
+        reply = client.run(path=path, backend=args.backend)
+        for line in reply["output"]:
+            print(line)
+        for d in reply["diagnostics"]:
+            print("ERROR:", d, file=sys.stderr)
+        if reply["error"]:
+            print(reply["error"], file=sys.stderr)
+        failed |= reply["status"] == "error"
+    if args.stats:
+        for k, v in client.stats().items():
+            print(f"{k} : {v}")
+    client.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# Parallel front end for large workflow files. The text is cut before
+# top-level `step` lines (incremental.split_units) into one contiguous piece
+# per worker process. In a first round the workers lex and parse their piece
+# and collect its declarations; the parent merges those into one symbol
+# table. In a second round the workers type check and lower their piece (the
+# AST stays in the worker in between). Every piece is lowered with the temp
+# and instruction counts of the pieces before it, measured on the ASTs in
+# the first round, so temp and label names, and the whole result, are those
+# of a serial compile.
+#
+# Shipping the pieces between processes is the cost the extra cores have to
+# pay back, so it is kept small: a worker receives only the declarations and
+# value types of the names its piece looks up, and returns its TAC as plain
+# tuples (pickled about twice as fast as TACInstr objects). It is opt-in
+# (main.py --frontend-jobs) and only pays off with as many idle cores.
+import gc
+import multiprocessing
+import os
+
+from ast import (
+    CHILDREN,
+    NOT_CODE,
+    Assign,
+    BinOp,
+    Goto,
+    If,
+    Print,
+    Program,
+    Repeat,
+    Step,
+    names_of,
+)
+from incremental import split_units
+from ir import IRGen, TACInstr
+from main import compile_program
+from parser import parse_code
+from semantic import SymbolTable, check_stmts, collect_decls
+
+# TAC instructions and temps IRGen emits for a node, besides its children's
+IR_SIZE = {Step: 1, Goto: 1, Print: 1, Assign: 1, Repeat: 4, If: 2, BinOp: 1}
+IR_TEMPS = {Repeat: 1, BinOp: 1}
+
+
+def lowered_size(stmts):
+    # (instructions, temps) of IRGen.generate on the statements
+    code = temps = 0
+    work = list(stmts)
+    while work:
+        n = work.pop()
+        t = type(n)
+        code += IR_SIZE.get(t, 0)
+        temps += IR_TEMPS.get(t, 0)
+        work += CHILDREN[t](n)
+    return code, temps
+
+
+def compile_serial(code, ast=True):
+    # -> (prog, st, diagnostics, tac): the front end in this process
+    prog, st, diagnostics, tac, removed = compile_program(code, optimized=False)
+    return prog if ast else None, st, diagnostics, tac
+
+
+def pieces(code, n):
+    # [(text, first line)]: at most n runs of whole units of similar size.
+    # Never cut inside a string literal, and number lines as the lexer does,
+    # which does not count the line breaks within strings.
+    strings = [
+        (m.start(), m.end(), m.group().count("\n"))
+        for m in NOT_CODE.finditer(code)
+        if m.group().startswith('"')
+    ]
+    target = len(code) / n
+    out, start, line = [], 0, 1
+    offset = hidden = i = 0
+    for text, _ in split_units(code)[:-1]:
+        offset += len(text)
+        while i < len(strings) and strings[i][1] <= offset:
+            hidden += strings[i][2]
+            i += 1
+        if i < len(strings) and strings[i][0] < offset:
+            continue
+        if offset >= target * (len(out) + 1):
+            out.append((code[start:offset], line))
+            start, line = offset, code.count("\n", 0, offset) - hidden + 1
+    out.append((code[start:], line))
+    return out
+
+
+def _restrict(st, types, names):
+    # the symbol table and value types of `names` only
+    piece = SymbolTable()
+    for name in names:
+        typ = st.lookup(name)
+        if typ is not None:
+            piece.declare(name, typ)
+    return piece, {name: types[name] for name in names if name in types}
+
+
+def _worker(conn):
+    # ("parse", text, line) -> ("ok", declarations, lowered_size, names)
+    # ("lower", st, types, temp_base, code_base, ast)
+    #     -> ("ok", diagnostics, TAC tuples, statements or None)
+    # where names are those the piece looks up (ast.names_of), and st
+    # and types cover them
+    # ASTs and TAC hold no reference cycles (see IRGen.generate): the cyclic
+    # GC would only rescan them, in pickling as well
+    gc.disable()
+    stmts = None
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        try:
+            if msg[0] == "parse":
+                _, text, line = msg
+                stmts = parse_code(text, line).stmts
+                decls = SymbolTable()
+                for s in stmts:
+                    collect_decls(s, decls)
+                reply = ("ok", decls, lowered_size(stmts), names_of(stmts)[0])
+            else:
+                _, st, types, temp_base, code_base, ast = msg
+                diagnostics = check_stmts(stmts, st)
+                tac = IRGen(temp_base, types, code_base).generate(Program(stmts))
+                tac = [(i.op, i.a, i.b, i.c, i.src) for i in tac]
+                reply = ("ok", diagnostics, tac, stmts if ast else None)
+                stmts = None
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        conn.send(reply)
+    conn.close()
+
+
+class FrontEnd:
+    # a pool of `jobs` front-end worker processes, started on first use and
+    # kept for later compiles
+    def __init__(self, jobs=None):
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        self.workers = []  # (process, connection)
+
+    def _start(self, n):
+        ctx = multiprocessing.get_context("fork")
+        while len(self.workers) < n:
+            conn, child = ctx.Pipe()
+            p = ctx.Process(target=_worker, args=(child,), daemon=True)
+            p.start()
+            child.close()
+            self.workers.append((p, conn))
+
+    def close(self):
+        for p, conn in self.workers:
+            conn.send(None)
+            conn.close()
+            p.join()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _round(self, workers, messages):
+        for (p, conn), msg in zip(workers, messages):
+            conn.send(msg)
+        # unpickling the pieces' TAC and ASTs runs several times faster
+        # without the cyclic GC
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            replies = [conn.recv() for p, conn in workers]
+        finally:
+            if enabled:
+                gc.enable()
+        return None if any(r[0] == "error" for r in replies) else replies
+
+    def compile(self, code, ast=True):
+        # -> (prog, st, diagnostics, tac), equal to compile_serial(code);
+        # prog is None unless `ast`. A piece that fails (a syntax error, or
+        # a cut that only fails on its own) makes the whole text compile
+        # serially, so errors are those of a serial compile.
+        parts = pieces(code, self.jobs) if self.jobs > 1 else []
+        if len(parts) < 2:
+            return compile_serial(code, ast)
+        self._start(len(parts))
+        workers = self.workers[: len(parts)]
+        replies = self._round(workers, [("parse", text, line) for text, line in parts])
+        if replies is None:
+            return compile_serial(code, ast)
+        st = SymbolTable()
+        for _, decls, _, _ in replies:
+            st.update(decls)
+        types = st.value_types()
+        messages = []
+        temp_base = code_base = 0
+        for _, _, (size, temps), names in replies:
+            piece, piece_types = _restrict(st, types, names)
+            messages.append(("lower", piece, piece_types, temp_base, code_base, ast))
+            code_base += size
+            temp_base += temps
+        replies = self._round(workers, messages)
+        if replies is None:
+            return compile_serial(code, ast)
+        stmts, diagnostics, tac = [], [], []
+        for _, d, t, s in replies:
+            diagnostics += d
+            for op, a, b, c, src in t:
+                instr = TACInstr(op, a, b, c)
+                instr.src = src
+                tac.append(instr)
+            if ast:
+                stmts += s
+        return Program(stmts) if ast else None, st, diagnostics, tac
@@ -0,0 +1,183 @@
+# Incremental compilation at step granularity. Every line starting with
+# `step <name>` opens a unit (the text before the first one is a unit too).
+# Units are cached by content: after an edit only the units whose text
+# changed are re-lexed, parsed, lowered and optimized; the others keep their
+# AST, IR and optimized TAC, and the whole program is relinked. A unit is
+# lowered again (binop type tags) when the value types of the variables it
+# uses change.
+import hashlib
+import re
+
+from ast import CHILDREN, NOT_CODE, Program, names_of
+from ir import IRGen
+from optimizer import optimize
+from parser import ParserError, parse_code
+from semantic import SymbolTable, check_stmts, collect_decls
+
+STEP_LINE = re.compile(r"^[ \t]*step[ \t]+[A-Za-z_]", re.M)
+
+
+class Unit:
+    # one compiled unit; `line` is the line its text starts on
+    __slots__ = (
+        "line",
+        "stmts",
+        "decls",
+        "refs",
+        "steps",
+        "signature",
+        "types",
+        "diagnostics",
+        "tac",
+        "opt",
+        "removed",
+        "temps",
+    )
+
+    def __init__(self, line):
+        self.line = line
+        # (base, size): the temp numbers base .. base + size - 1 its lowering
+        # may use (IRGen temp_base and temp_count), None until lowered
+        self.temps = None
+        self.signature = None  # types of `refs` the diagnostics were made with
+        self.types = None  # value types of `refs` the TAC was lowered with
+
+
+def split_units(code):
+    # [(text, first line)], cut before every `step` line at brace depth 0
+    cuts = [0] + [m.start() for m in STEP_LINE.finditer(code) if m.start()]
+    cuts.append(len(code))
+    units, depth, line = [], 0, 1
+    for start, end in zip(cuts, cuts[1:]):
+        text = code[start:end]
+        if depth > 0:
+            units[-1] = (units[-1][0] + text, units[-1][1])
+        else:
+            units.append((text, line))
+        stripped = NOT_CODE.sub("", text)
+        depth += stripped.count("{") - stripped.count("}")
+        line += text.count("\n")
+    return units
+
+
+def _shift(unit, delta):
+    # move a cached unit `delta` lines down: AST positions and TAC sources
+    work = list(unit.stmts)
+    while work:
+        n = work.pop()
+        if n.line is not None:
+            n.line += delta
+        work += CHILDREN[type(n)](n)
+    seen = set()
+    for instr in unit.tac + unit.opt + unit.removed:
+        if id(instr) not in seen:
+            seen.add(id(instr))
+            if instr.src and instr.src[0] is not None:
+                instr.src = (instr.src[0] + delta, instr.src[1])
+    unit.line += delta
+
+
+class IncrementalCompiler:
+    def __init__(self):
+        self.units = {}  # (content hash, occurrence) -> Unit
+        # every unit owns a range of temp numbers (Unit.temps), so temps of
+        # different units never share a name and a unit lowered again leaves
+        # the names in the others alone; ranges of dropped units are reused
+        self.next_temp = 0  # no range reaches this number
+        self.free = []  # ranges no unit owns, below next_temp
+        self.rebuilt = self.total = 0
+
+    def _build(self, text, line):
+        unit = Unit(line)
+        unit.stmts = parse_code(text, line).stmts
+        unit.decls = SymbolTable()
+        for s in unit.stmts:
+            collect_decls(s, unit.decls)
+        unit.refs, unit.steps = names_of(unit.stmts)
+        unit.tac = unit.opt = unit.removed = []  # lowered in compile()
+        return unit
+
+    def _release(self, temps):
+        base, size = temps
+        self.free.append(temps)
+        # ranges at the top go back to next_temp
+        self.free.sort()
+        while self.free and sum(self.free[-1]) == self.next_temp:
+            self.next_temp = self.free.pop()[0]
+
+    def _lower(self, unit, types):
+        # in the unit's own range (a new unit takes the largest free one);
+        # only a unit that outgrows it moves to a fresh range at the top
+        if unit.temps is None and self.free:
+            unit.temps = max(self.free, key=lambda r: r[1])
+            self.free.remove(unit.temps)
+        tac = None
+        if unit.temps is not None:
+            base, size = unit.temps
+            irgen = IRGen(base, types)
+            tac = irgen.generate(Program(unit.stmts))
+            if irgen.temp_count >= base + size:
+                self._release(unit.temps)
+                tac = None
+        if tac is None:
+            irgen = IRGen(self.next_temp, types)
+            tac = irgen.generate(Program(unit.stmts))
+            unit.temps = (self.next_temp, irgen.temp_count + 1 - self.next_temp)
+            self.next_temp = irgen.temp_count + 1
+        unit.tac = tac
+        unit.opt, unit.removed = optimize(unit.tac, entries=unit.steps)
+
+    def compile(self, code):
+        # -> (prog, st, diagnostics, tac, optimized tac, removed), like the
+        # front end and optimizer run on the whole text
+        pieces = split_units(code)
+        old = self.units
+        units, cache, seen = [], {}, {}
+        self.rebuilt = 0
+        try:
+            for text, line in pieces:
+                h = hashlib.sha1(text.encode()).digest()
+                key = (h, seen.get(h, 0))
+                seen[h] = key[1] + 1
+                unit = self.units.get(key)
+                if unit is None:
+                    unit = self._build(text, line)
+                    self.rebuilt += 1
+                elif unit.line != line:
+                    _shift(unit, line - unit.line)
+                cache[key] = unit
+                units.append(unit)
+        except (ParserError, SyntaxError):
+            # report the error the whole text gives; a piece that only
+            # fails on its own (cut inside a string) compiles as one unit
+            parse_code(code)
+            self.units = {}
+            units = [self._build(code, 1)]
+            cache = {(hashlib.sha1(code.encode()).digest(), 0): units[0]}
+            self.rebuilt = 1
+        self.units = cache
+        kept = set(map(id, units))
+        for unit in old.values():
+            if id(unit) not in kept and unit.temps is not None:
+                self._release(unit.temps)
+        self.total = len(units)
+        st = SymbolTable()
+        for unit in units:
+            st.update(unit.decls)
+        value_types = st.value_types()
+        diagnostics, stmts, tac, opt, removed = [], [], [], [], []
+        for unit in units:
+            types = tuple(value_types.get(n) for n in unit.refs)
+            if types != unit.types:
+                self._lower(unit, value_types)
+                unit.types = types
+            signature = tuple(st.lookup(n) for n in unit.refs)
+            if signature != unit.signature:
+                unit.diagnostics = check_stmts(unit.stmts, st)
+                unit.signature = signature
+            diagnostics += unit.diagnostics
+            stmts += unit.stmts
+            tac += unit.tac
+            opt += unit.opt
+            removed += unit.removed
+        return Program(stmts), st, diagnostics, tac, opt, removed
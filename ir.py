@@ -1,5 +1,8 @@
 # Generate simple three-address code (TAC) from AST
+import gc
+
 from ast import *
+from semantic import value_type
 
 
 class TACInstr:
@@ -30,10 +33,42 @@ class TACInstr:
         return " ".join(parts)
 
 
+OPMAP = {
+    "PLUS": "+",
+    "MINUS": "-",
+    "TIMES": "*",
+    "DIV": "/",
+    "EQ": "==",
+    "NE": "!=",
+    "LT": "<",
+    "GT": ">",
+    "LE": "<=",
+    "GE": ">=",
+    "AND": "and",
+    "OR": "or",
+}
+
+
+# binop type tags (TACInstr.c): "int" when both operands are ints or bools,
+# "bool" for and/or of two bools; codegen then runs the operator without
+# coercing its operands
+NUMERIC = frozenset(("int", "bool"))
+BOOL = frozenset(("bool",))
+INT = frozenset(("int",))
+VALUE_TYPES = {"int": INT, "bool": BOOL}
+
+
 class IRGen:
-    def __init__(self):
-        self.temp_count = 0
+    # temp_base: temps are numbered from temp_base + 1 (and labels carry the
+    # temp count), so pieces lowered with disjoint ranges never clash.
+    # code_base: instructions lowered before this piece (labels carry the
+    # position too). types: SymbolTable.value_types() of the whole program,
+    # to tag binops with the types of their operands (None: no tags)
+    def __init__(self, temp_base=0, types=None, code_base=0):
+        self.temp_count = temp_base
+        self.code_base = code_base
         self.code = []
+        self.types = types
 
     def newtemp(self):
         self.temp_count += 1
@@ -43,88 +78,154 @@ class IRGen:
         self.code.append(instr)
 
     def generate(self, prog):
-        for s in prog.stmts:
-            self.gen_stmt(s)
+        # TAC instructions cannot form reference cycles either (see
+        # lexer.tokenize): without the cyclic GC rescanning the AST and the
+        # growing code list, lowering runs several times faster
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for s in prog.stmts:
+                self.gen_stmt(s)
+        finally:
+            if enabled:
+                gc.enable()
         return self.code
 
     def gen_stmt(self, stmt):
-        if isinstance(stmt, Step):
-            instr = TACInstr("label", stmt.name)
-            self.emit(instr)
-            instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-        elif isinstance(stmt, Goto):
-            instr = TACInstr("goto", stmt.target)
-            self.emit(instr)
-            instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-        elif isinstance(stmt, Print):
-            t = self.gen_expr(stmt.expr)
-            instr = TACInstr("print", t)
-            self.emit(instr)
-            instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-        elif isinstance(stmt, Assign):
-            t = self.gen_expr(stmt.expr)
-            instr = TACInstr("assign", stmt.name, t)
-            self.emit(instr)
-            instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-        elif isinstance(stmt, Repeat):
-            start = f"L{len(self.code)}_{self.temp_count}"
-            end = f"END{len(self.code)}_{self.temp_count}"
-            counter = self.newtemp()
-            instr1 = TACInstr("assign", counter, stmt.count)
-            instr1.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-            self.emit(instr1)
-            instr2 = TACInstr("label", start)
-            instr2.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-            self.emit(instr2)
-            for s in stmt.block:
-                self.gen_stmt(s)
-            # decrement the loop counter using a proper binop so optimizer/runtime can evaluate it
-            instr3 = TACInstr("binop", counter, f"{counter} - 1")
-            instr3.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-            self.emit(instr3)
-            instr4 = TACInstr("if_gt", counter, "0", f"goto {start}")
-            instr4.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-            self.emit(instr4)
-        elif isinstance(stmt, If):
-            t = self.gen_expr(stmt.cond)
-            skip = f"END_IF{len(self.code)}_{self.temp_count}"
-            instr = TACInstr("if_false", t, skip)
-            instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-            self.emit(instr)
-            for s in stmt.block:
-                self.gen_stmt(s)
-            instr2 = TACInstr("label", skip)
-            instr2.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
-            self.emit(instr2)
+        # explicit work stack instead of recursion: items are statements still
+        # to lower or loop-tail instructions waiting for their block to finish
+        table = self.STMT
+        work = [stmt]
+        while work:
+            stmt = work.pop()
+            table[type(stmt)](self, stmt, work)
+
+    # statement lowering: handler(self, stmt, work), see ast.Dispatch
+    STMT = Dispatch(lambda self, stmt, work: None)
+
+    @STMT.on(TACInstr)
+    def _lower_tail(self, instr, work):
+        self.emit(instr)
+
+    @STMT.on(Step)
+    def _lower_step(self, stmt, work):
+        instr = TACInstr("label", stmt.name)
+        self.emit(instr)
+        instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
+
+    @STMT.on(Goto)
+    def _lower_goto(self, stmt, work):
+        instr = TACInstr("goto", stmt.target)
+        self.emit(instr)
+        instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
+
+    @STMT.on(Print)
+    def _lower_print(self, stmt, work):
+        t = self.gen_expr(stmt.expr)
+        instr = TACInstr("print", t)
+        self.emit(instr)
+        instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
+
+    @STMT.on(Assign)
+    def _lower_assign(self, stmt, work):
+        t = self.gen_expr(stmt.expr)
+        instr = TACInstr("assign", stmt.name, t)
+        self.emit(instr)
+        instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
+
+    @STMT.on(Repeat)
+    def _lower_repeat(self, stmt, work):
+        src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
+        start = f"L{self.code_base + len(self.code)}_{self.temp_count}"
+        counter = self.newtemp()
+        instr1 = TACInstr("assign", counter, stmt.count)
+        instr1.src = src
+        self.emit(instr1)
+        instr2 = TACInstr("label", start)
+        instr2.src = src
+        self.emit(instr2)
+        # decrement the loop counter using a proper binop so optimizer/runtime can evaluate it
+        instr3 = TACInstr("binop", counter, f"{counter} - 1")
+        instr3.src = src
+        instr4 = TACInstr("if_gt", counter, "0", f"goto {start}")
+        instr4.src = src
+        work.append(instr4)
+        work.append(instr3)
+        work.extend(reversed(stmt.block))
+
+    @STMT.on(If)
+    def _lower_if(self, stmt, work):
+        t = self.gen_expr(stmt.cond)
+        skip = f"END_IF{self.code_base + len(self.code)}_{self.temp_count}"
+        instr = TACInstr("if_false", t, skip)
+        instr.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
+        self.emit(instr)
+        instr2 = TACInstr("label", skip)
+        instr2.src = (getattr(stmt, "line", None), getattr(stmt, "col", None))
+        work.append(instr2)
+        work.extend(reversed(stmt.block))
 
     def gen_expr(self, expr):
-        if isinstance(expr, Number):
-            return expr.value
-        if isinstance(expr, String):
-            return f'"{expr.value}"'
-        if isinstance(expr, Var):
-            return expr.name
-        if isinstance(expr, BinOp):
-            a = self.gen_expr(expr.left)
-            b = self.gen_expr(expr.right)
-            t = self.newtemp()
-            op = expr.op
-            opmap = {
-                "PLUS": "+",
-                "MINUS": "-",
-                "TIMES": "*",
-                "DIV": "/",
-                "EQ": "==",
-                "NE": "!=",
-                "LT": "<",
-                "GT": ">",
-                "LE": "<=",
-                "GE": ">=",
-                "AND": "and",
-                "OR": "or",
-            }
-            sym = opmap.get(op, op)
-            instr = TACInstr("binop", t, f"{a} {sym} {b}")
-            instr.src = (getattr(expr, "line", None), getattr(expr, "col", None))
-            self.emit(instr)
-            return t
+        # post-order walk with explicit stacks; long operator chains parse
+        # into deep left-leaning trees. `work` holds (handler, node) pairs.
+        table = self.EXPR
+        results = []
+        work = [(table[type(expr)], expr)]
+        while work:
+            fn, expr = work.pop()
+            fn(self, expr, results, work)
+        return results[0]
+
+    # expression lowering: handler(self, expr, results, work) pushes the
+    # operand holding expr's value on `results` or schedules more work
+    EXPR = Dispatch(lambda self, expr, results, work: results.append(None))
+
+    @EXPR.on(Number)
+    def _lower_number(self, expr, results, work):
+        results.append(expr.value)
+
+    @EXPR.on(String)
+    def _lower_string(self, expr, results, work):
+        results.append(f'"{expr.value}"')
+
+    @EXPR.on(Var)
+    def _lower_var(self, expr, results, work):
+        results.append(expr.name)
+
+    @EXPR.on(BinOp)
+    def _lower_binop(self, expr, results, work):
+        table = self.EXPR
+        work.append((IRGen._lower_operands, expr))
+        work.append((table[type(expr.right)], expr.right))
+        work.append((table[type(expr.left)], expr.left))
+
+    def _lower_operands(self, expr, results, work):
+        b = results.pop()
+        a = results.pop()
+        t = self.newtemp()
+        sym = OPMAP.get(expr.op, expr.op)
+        tag = None if self.types is None else self.type_tag(expr)
+        instr = TACInstr("binop", t, f"{a} {sym} {b}", tag)
+        instr.src = (getattr(expr, "line", None), getattr(expr, "col", None))
+        self.emit(instr)
+        results.append(t)
+
+    def operand_types(self, expr):
+        # the types an operand's value can have (None for a string literal
+        # or an operator that may yield one, see semantic.value_type)
+        t = type(expr)
+        if t is Var:
+            return self.types.get(expr.name, INT)
+        if t is BinOp:
+            return VALUE_TYPES.get(value_type(expr))
+        return INT if t is Number else None
+
+    def type_tag(self, expr):
+        left = self.operand_types(expr.left)
+        right = self.operand_types(expr.right)
+        if left is None or right is None:
+            return None
+        if expr.op in ("AND", "OR"):
+            return "bool" if left == right == BOOL else None
+        return "int" if left <= NUMERIC and right <= NUMERIC else None
+
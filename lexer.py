@@ -1,4 +1,4 @@
-import re, sys
+import codecs, gc, re, sys
 TOKEN_SPEC = [
     ('NUMBER',   r'\d+'),
     ('STRING',   r'"([^"\\]|\\.)*"'),
@@ -25,7 +25,23 @@ KEYWORDS = {'step','goto','print','repeat','times','if','then','and','or','not'}
 tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in TOKEN_SPEC)
 get_token = re.compile(tok_regex).match
 
+# Fast scanner used by iter_tokens. Whitespace and comments are swallowed
+# in bulk in front of every token, keywords get their own group, and the
+# token kind is dispatched on mo.lastindex instead of group names.
+_FAST_SPEC = [('KEYWORD', r'(?:%s)(?![A-Za-z0-9_])' % '|'.join(sorted(KEYWORDS)))]
+_FAST_SPEC += [(n, r'"(?:[^"\\]|\\.)*"' if n == 'STRING' else rx)
+               for n, rx in TOKEN_SPEC if n not in ('SKIP', 'COMMENT')]
+# trailing whitespace/comments end in an empty END match instead of letting
+# the regex backtrack into them
+_FAST_SPEC.append(('END', r'\Z'))
+_scan = re.compile(r'(?:[ \t]+|\#.*)*(?:%s)'
+                   % '|'.join('(%s)' % rx for _, rx in _FAST_SPEC)).finditer
+_KIND = [None] + [n for n, _ in _FAST_SPEC]
+_KEYWORD_TYPE = {k: k.upper() for k in KEYWORDS}
+_BLOCK = 1 << 16
+
 class Token:
+    __slots__ = ('type', 'value', 'line', 'col')
     def __init__(self, type, value, line, col):
         self.type = type
         self.value = value
@@ -34,35 +50,82 @@ class Token:
     def __repr__(self):
         return f'Token({self.type},{self.value!r},{self.line},{self.col})'
 
-def tokenize(code):
-    mo = get_token(code)
-    index = 0
-    tokens = []
-    cur_line = 1
+def _read_blocks(f):
+    # text or binary file objects and mmaps, in large blocks
+    decoder = None
+    while True:
+        data = f.read(_BLOCK)
+        if not data:
+            if decoder is not None:
+                tail = decoder.decode(b'', True)
+                if tail:
+                    yield tail
+            return
+        if isinstance(data, (bytes, bytearray)):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            data = decoder.decode(data)
+        if data:
+            yield data
+
+def iter_tokens(src, line=1):
+    # lazily tokenize a string, a file object or an mmap'd file. Input is
+    # scanned up to the last complete line; the partial line (or a string
+    # literal still waiting for its closing quote) is carried into the next
+    # block, so only one block is buffered at a time. `line` numbers the
+    # first line (for a piece cut out of a bigger file).
+    chunks = iter((src,)) if isinstance(src, str) else _read_blocks(src)
+    kinds = _KIND
+    keyword_type = _KEYWORD_TYPE
+    buf = ''
+    pos = 0
+    cur_line = line
     cur_col = 1
-    while mo is not None:
-        typ = mo.lastgroup
-        val = mo.group(typ)
-        if typ == 'NEWLINE':
-            tokens.append(Token('NEWLINE','\n',cur_line,cur_col))
-            cur_line += 1
-            cur_col = 1
-        elif typ == 'SKIP' or typ == 'COMMENT':
-            pass
-        elif typ == 'MISMATCH':
-            raise SyntaxError(f'Unexpected character {val!r} at line {cur_line} col {cur_col}')
+    more = next(chunks, None)
+    while more is not None:
+        buf = buf[pos:] + more
+        pos = 0
+        more = next(chunks, None)
+        final = more is None
+        limit = len(buf) if final else buf.rfind('\n') + 1
+        for mo in _scan(buf, 0, limit):
+            i = mo.lastindex
+            typ = kinds[i]
+            val = mo.group(i)
+            if typ == 'NEWLINE':
+                yield Token('NEWLINE','\n',cur_line,cur_col)
+                cur_line += 1
+                cur_col = 1
+            elif typ == 'END':
+                continue
+            elif typ == 'MISMATCH':
+                if val == '"' and not final:
+                    # possibly a string literal continuing in the next block
+                    pos = mo.start(i)
+                    break
+                raise SyntaxError(f'Unexpected character {val!r} at line {cur_line} col {cur_col}')
+            else:
+                if typ == 'KEYWORD':
+                    typ = keyword_type[val]
+                yield Token(typ,val,cur_line,cur_col)
+                cur_col += len(val)
         else:
-            if typ == 'ID' and val in KEYWORDS:
-                typ = val.upper()
-            tokens.append(Token(typ,val,cur_line,cur_col))
-            cur_col += len(val)
-        index = mo.end()
-        mo = get_token(code, index)
-    tokens.append(Token('EOF','',cur_line,cur_col))
-    return tokens
+            pos = limit
+    yield Token('EOF','',cur_line,cur_col)
+
+def tokenize(code):
+    # tokens cannot form reference cycles, so keep the cyclic GC from
+    # rescanning the growing list while it is built
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return list(iter_tokens(code))
+    finally:
+        if enabled:
+            gc.enable()
 
 if __name__=='__main__':
     import sys
-    code = open(sys.argv[1]).read()
-    for t in tokenize(code):
-        print(t)
+    with open(sys.argv[1]) as f:
+        for t in iter_tokens(f):
+            print(t)
@@ -1,184 +1,780 @@
+import argparse
+import os
 import sys
+import time
 from lexer import tokenize
-from parser import parse_code
+from parser import Parser, parse_code, parse_file, ParserError
 from semantic import check_program, SemanticError
 from ir import IRGen
-from optimizer import constant_folding, dead_code_elim
-from codegen import run_tac
+from optimizer import optimize
+from codegen import State, link, run_tac, TEMP
+from pybackend import run_pyc
+from mfc import Module, ModuleCache
+from incremental import IncrementalCompiler
+from profiler import Profile
+from telemetry import Telemetry, count_nodes
+from sinks import CallbackSink, FileSink
 from ast import *
 
 
-def compile_and_run(code):
+BACKENDS = {"tac": run_tac, "pyc": run_pyc}
+
+
+def _call(name, fn, *args):
+    return fn(*args)
+
+
+def compile_and_run(
+    code,
+    backend="tac",
+    cache=None,
+    sink=None,
+    profile=None,
+    telemetry=None,
+    keep=None,
+    frontend=None,
+    bindings=None,
+):
+    # code: source text, or an open file that is tokenized as it is read.
+    # telemetry: a telemetry.Telemetry to record every phase and the
+    # pipeline statistics in. keep: None keeps every representation for the
+    # caller; otherwise only those named ("ast", "tac", "opt", "removed") are
+    # returned and the rest (None) are dropped as soon as the next phase has
+    # consumed them. frontend: a frontend.FrontEnd to lex, parse, check and
+    # lower the source text (a str) in its worker processes. bindings:
+    # initial {variable: value} of a TAC interpreter run; the program is
+    # then lowered untyped and optimized without assuming that variables
+    # start at 0 (see codegen.bind), and neither cached nor compiled by
+    # `frontend`.
+    phase = _call if telemetry is None else telemetry.phase
+    if bindings is not None:
+        if backend != "tac":
+            raise ValueError("Runs with bindings use the TAC interpreter")
+        cache = frontend = None
+    mod = cache.get(code) if cache is not None else None
+    if mod is not None:
+        # cache hit: front end and optimizer are skipped entirely, so the
+        # unoptimized TAC, DCE report and AST are not available
+        tac, tac3, st, diagnostics, removed, prog = (
+            None, mod.tac, mod.st, mod.diagnostics, None, None
+        )
+        if telemetry is not None:
+            telemetry.stats(cache="hit", tac_optimized=len(tac3))
+    else:
+        if frontend is not None:
+            prog, st, diagnostics, tac = phase(
+                "frontend", frontend.compile, code, keep is None or "ast" in keep
+            )
+        else:
+            if telemetry is not None:
+                # tokens are materialized to count them and time the lexer alone
+                tokens = phase("tokenize", tokenize, code)
+                prog = phase("parse", Parser(tokens).parse)
+                telemetry.stats(tokens=len(tokens), ast_nodes=count_nodes(prog))
+                tokens = None
+            elif isinstance(code, str):
+                prog = parse_code(code)
+            else:
+                prog = parse_file(code)
+            st, diagnostics = phase("check", check_program, prog)
+            types = None if bindings is not None else st.value_types()
+            tac = phase("irgen", IRGen(types=types).generate, prog)
+        if keep is not None and "ast" not in keep:
+            prog = None
+        # optimization
+        tac3, removed = optimize(
+            tac,
+            entries=() if bindings is not None else None,
+            run_pass=telemetry and telemetry.run_pass,
+        )
+        if telemetry is not None:
+            telemetry.stats(tac=len(tac), tac_optimized=len(tac3))
+        if keep is not None:
+            if "tac" not in keep:
+                tac = None
+            if "removed" not in keep:
+                removed = None
+        if cache is not None:
+            cache.put(code, Module(tac3, st, diagnostics))
+    # link/decode once (variables and temps get frame slots), then execute
+    linked = phase("link", link, tac3, st, True, bindings is not None)
+    if keep is not None and "opt" not in keep:
+        tac3 = None
+    # out is whatever the sink returns: the output list by default
+    if profile is not None:
+        # instrumented interpreter loop (profiler.Profile) instead of backend
+        out = profile.run(linked, sink, st, bindings)
+        executed = sum(profile.counts)
+    elif backend == "tac":
+        # counted by the run itself (State.executed)
+        state = State(linked, bindings)
+        out = phase("run", run_tac, linked, sink, None, state)
+        executed = state.executed
+    else:
+        # generated Python code dispatches no instructions to count
+        out = phase("run", BACKENDS[backend], linked, sink)
+        executed = None
+    if telemetry is not None:
+        telemetry.stats(linked=len(linked), instructions_executed=executed)
+    return out, tac, tac3, st, diagnostics, removed, prog, linked
+
+
+def compile_program(code, optimized=True, bindings=False):
+    # source text -> (prog, st, diagnostics, tac, removed): parse, check,
+    # lower and optimize, the pipeline every compile of a whole source
+    # shares. optimized=False stops after lowering (removed is None).
+    # bindings: for runs with bindings, lowered untyped and optimized
+    # without assuming that variables start at 0 (see codegen.bind)
     prog = parse_code(code)
     st, diagnostics = check_program(prog)
-    irgen = IRGen()
-    tac = irgen.generate(prog)
-    # optimization
-    tac2 = constant_folding(tac)
-    tac3, removed = dead_code_elim(tac2)
-    out = run_tac(tac3)
-    return out, tac, tac3, st, diagnostics, removed, prog
+    tac = IRGen(types=None if bindings else st.value_types()).generate(prog)
+    removed = None
+    if optimized:
+        tac, removed = optimize(tac, entries=() if bindings else None)
+    return prog, st, diagnostics, tac, removed
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python main.py file.mf")
-        sys.exit(1)
-    code = open(sys.argv[1]).read()
-    out, tac, tacopt, st, diagnostics, removed, prog = compile_and_run(code)
-    print("=== OUTPUT ===")
-    for line in out:
-        print(line)
-    print()
-    print("=== TAC ===")
-    for t in tac:
-        # simple one-line TAC for readability
-        try:
-            print(t.simple())
-        except Exception:
-            print(t)
-    print()
-    print("=== OPT TAC ===")
-    for t in tacopt:
+def compile_module(code):
+    # front end and optimizer only: the module compile_and_run would cache
+    prog, st, diagnostics, tac, removed = compile_program(code)
+    return Module(tac, st, diagnostics)
+
+
+def watch(path, backend="tac", interval=0.2, flush_lines=1024):
+    # recompile (incrementally, step by step) and rerun whenever the file
+    # changes; runs until interrupted
+    inc = IncrementalCompiler()
+    seen = None
+    while True:
         try:
-            print(t.simple())
-        except Exception:
-            print(t)
-    print()
-    print("=== SYMBOL TABLE ===")
-    for k, v in st.items():
-        print(f"{k} : {v}")
-    print()
+            stamp = os.stat(path).st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp is not None and stamp != seen:
+            seen = stamp
+            with open(path) as f:
+                code = f.read()
+            start = time.perf_counter()
+            try:
+                prog, st, diagnostics, tac, tac3, removed = inc.compile(code)
+                linked = link(tac3, st)
+            except (ParserError, SyntaxError) as e:
+                print(f"=== {path}: {e} ===")
+            else:
+                ms = (time.perf_counter() - start) * 1000
+                print(
+                    f"=== {path}: recompiled in {ms:.1f} ms "
+                    f"({inc.rebuilt}/{inc.total} units rebuilt) ==="
+                )
+                for d in diagnostics:
+                    print("ERROR:", d)
+                sink = FileSink(sys.stdout, flush_lines=flush_lines)
+                try:
+                    BACKENDS[backend](linked, sink)
+                except Exception as e:
+                    sink.finish()
+                    print(f"{type(e).__name__}: {e}")
+            sys.stdout.flush()
+        time.sleep(interval)
+
+
+OPSYM = {
+    "PLUS": "+",
+    "MINUS": "-",
+    "TIMES": "*",
+    "DIV": "/",
+    "EQ": "==",
+    "NE": "!=",
+    "LT": "<",
+    "GT": ">",
+    "LE": "<=",
+    "GE": ">=",
+    "AND": "and",
+    "OR": "or",
+}
+
+
+def _render(root, indent, parts, write=None):
+    # Drive a printer without recursion: parts[type(node)](node, indent)
+    # returns the node's output as a list of strings and (child, indent)
+    # pairs, which are expanded in order with an explicit stack and joined
+    # once. With `write`, the text is handed to it in chunks as it is
+    # produced instead of being returned.
+    out = []
+    work = [(root, indent)]
+    while work:
+        item = work.pop()
+        if type(item) is str:
+            out.append(item)
+            if write is not None and len(out) >= 4096:
+                write("".join(out))
+                out.clear()
+        else:
+            work.extend(reversed(parts[type(item[0])](*item)))
+    if write is None:
+        return "".join(out)
+    write("".join(out))
+
+
+# detailed tree dump: handler(node, indent) -> parts, see _render
+FORMAT = Dispatch(lambda n, indent: ["  " * indent + repr(n)])
+
+
+@FORMAT.on(Program)
+def _format_program(n, indent):
+    parts = ["  " * indent + f"Program"]
+    for x in n.stmts:
+        parts += ["\n", (x, indent + 1)]
+    return parts
+
+
+@FORMAT.on(Step)
+def _format_step(n, indent):
+    return ["  " * indent + f"Step {n.name} (@{n.line}:{n.col})"]
+
+
+@FORMAT.on(Goto)
+def _format_goto(n, indent):
+    return ["  " * indent + f"Goto {n.target} (@{n.line}:{n.col})"]
+
+
+@FORMAT.on(Print)
+def _format_print(n, indent):
+    return ["  " * indent + f"Print: ", (n.expr, indent + 1)]
+
+
+@FORMAT.on(Repeat)
+def _format_repeat(n, indent):
+    parts = ["  " * indent + f"Repeat {n.count} (@{n.line}:{n.col})"]
+    for x in n.block:
+        parts += ["\n", (x, indent + 1)]
+    return parts
+
+
+@FORMAT.on(If)
+def _format_if(n, indent):
+    parts = ["  " * indent + f"If (@{n.line}:{n.col}) Cond: ", (n.cond, 0)]
+    for x in n.block:
+        parts += ["\n", (x, indent + 1)]
+    return parts
+
+
+@FORMAT.on(Assign)
+def _format_assign(n, indent):
+    return ["  " * indent + f"Assign {n.name} = ", (n.expr, 0), f" (@{n.line}:{n.col})"]
+
+
+@FORMAT.on(BinOp)
+def _format_binop(n, indent):
+    return [
+        "  " * indent + f"BinOp {n.op} (@{n.line}:{n.col})\n",
+        (n.left, indent + 1),
+        "\n",
+        (n.right, indent + 1),
+    ]
+
+
+@FORMAT.on(Number)
+def _format_number(n, indent):
+    return ["  " * indent + f"Number {n.value} (@{n.line}:{n.col})"]
+
+
+@FORMAT.on(String)
+def _format_string(n, indent):
+    return ["  " * indent + f"String {n.value!r} (@{n.line}:{n.col})"]
+
+
+@FORMAT.on(Var)
+def _format_var(n, indent):
+    return ["  " * indent + f"Var {n.name} (@{n.line}:{n.col})"]
+
+
+def format_node(n, indent=0, write=None):
+    # detailed tree dump with source positions
+    return _render(n, indent, FORMAT, write)
+
+
+# expressions as source text
+EXPR_TEXT = Dispatch(lambda e, indent: [repr(e)])
+
+
+@EXPR_TEXT.on(Number)
+def _expr_number(e, indent):
+    return [str(e.value)]
+
+
+@EXPR_TEXT.on(String)
+def _expr_string(e, indent):
+    return [f'"{e.value}"']
+
+
+@EXPR_TEXT.on(Var)
+def _expr_var(e, indent):
+    return [e.name]
+
+
+@EXPR_TEXT.on(BinOp)
+def _expr_binop(e, indent):
+    sym = OPSYM.get(e.op, e.op)
+    return [(e.left, 0), f" {sym} ", (e.right, 0)]
+
+
+def expr_repr(e):
+    return _render(e, 0, EXPR_TEXT)
+
+
+# one readable line per statement
+SIMPLE = Dispatch(lambda n, indent: ["  " * indent + repr(n)])
+
+
+@SIMPLE.on(Program)
+def _simple_program(n, indent):
+    parts = []
+    for s in n.stmts:
+        if parts:
+            parts.append("\n")
+        parts.append((s, indent))
+    return parts
+
+
+@SIMPLE.on(Step)
+def _simple_step(n, indent):
+    return ["  " * indent + f"Step {n.name}"]
+
+
+@SIMPLE.on(Goto)
+def _simple_goto(n, indent):
+    return ["  " * indent + f"Goto {n.target}"]
+
+
+@SIMPLE.on(Print)
+def _simple_print(n, indent):
+    return ["  " * indent + f"Print {expr_repr(n.expr)}"]
+
+
+@SIMPLE.on(Assign)
+def _simple_assign(n, indent):
+    return ["  " * indent + f"{n.name} = {expr_repr(n.expr)}"]
+
+
+@SIMPLE.on(Repeat)
+def _simple_repeat(n, indent):
+    parts = ["  " * indent + f"Repeat {n.count} times"]
+    for s in n.block:
+        parts += ["\n", (s, indent + 1)]
+    return parts
+
+
+@SIMPLE.on(If)
+def _simple_if(n, indent):
+    parts = ["  " * indent + f"If {expr_repr(n.cond)}"]
+    for s in n.block:
+        parts += ["\n", (s, indent + 1)]
+    return parts
+
+
+def simple_ast(n, indent=0, write=None):
+    # very simple AST: one readable line per statement, indented for blocks
+    return _render(n, indent, SIMPLE, write)
+
+
+def _tac_text(t):
+    # simple one-line TAC for readability
+    try:
+        return t.simple()
+    except Exception:
+        return str(t)
+
+
+def _report_tac(f, r):
+    if r["tac"] is None:
+        f.write("(loaded from cache)\n")
+    for t in r["tac"] or ():
+        f.write(_tac_text(t) + "\n")
+
+
+def _report_opt(f, r):
+    for t in r["opt"]:
+        f.write(_tac_text(t) + "\n")
+
+
+def _report_symbols(f, r):
+    linked = r["linked"]
+    for k, v in r["st"].items():
+        slot = linked.slot_of(k) if v != "step" else None
+        if slot is None:
+            f.write(f"{k} : {v}\n")
+        else:
+            f.write(f"{k} : {v} (slot {slot})\n")
+    temps = [names for i, names in enumerate(linked.names) if linked.kinds[i] == TEMP]
+    if temps:
+        f.write(f"temps : {sum(map(len, temps))} in {len(temps)} slot(s)\n")
+
+
+def _report_diagnostics(f, r):
     # diagnostics (already collected during check)
-    print("=== DIAGNOSTICS ===")
-    if diagnostics:
-        for d in diagnostics:
-            print("ERROR:", d)
+    if r["diagnostics"]:
+        for d in r["diagnostics"]:
+            f.write(f"ERROR: {d}\n")
     else:
-        print("(no errors)")
-    print()
-
-    # DCE report
-    print("=== DCE REMOVED ===")
-    if removed:
-        print(f"{len(removed)} instruction(s) removed")
-        for r in removed:
-            try:
-                print(" -", r.simple())
-            except Exception:
-                print(" -", r)
+        f.write("(no errors)\n")
+
+
+def _report_dce(f, r):
+    removed = r["removed"]
+    if removed is None:
+        f.write("(loaded from cache)\n")
+    elif removed:
+        f.write(f"{len(removed)} instruction(s) removed\n")
+        for t in removed:
+            f.write(f" - {_tac_text(t)}\n")
     else:
-        print("(no instructions removed)")
-    print()
-
-    # Code structure printout
-    print("=== CODE ===")
-
-    def format_node(n, indent=0):
-        pad = "  " * indent
-        if isinstance(n, Program):
-            s = pad + f"Program"
-            for x in n.stmts:
-                s += "\n" + format_node(x, indent + 1)
-            return s
-        if isinstance(n, Step):
-            return pad + f"Step {n.name} (@{n.line}:{n.col})"
-        if isinstance(n, Goto):
-            return pad + f"Goto {n.target} (@{n.line}:{n.col})"
-        if isinstance(n, Print):
-            return pad + f"Print: " + format_node(n.expr, indent + 1)
-        if isinstance(n, Repeat):
-            s = pad + f"Repeat {n.count} (@{n.line}:{n.col})"
-            for x in n.block:
-                s += "\n" + format_node(x, indent + 1)
-            return s
-        if isinstance(n, If):
-            s = pad + f"If (@{n.line}:{n.col}) Cond: " + format_node(n.cond, 0)
-            for x in n.block:
-                s += "\n" + format_node(x, indent + 1)
-            return s
-        if isinstance(n, Assign):
-            return (
-                pad
-                + f"Assign {n.name} = "
-                + format_node(n.expr, 0)
-                + f" (@{n.line}:{n.col})"
-            )
-        if isinstance(n, BinOp):
-            return (
-                pad
-                + f"BinOp {n.op} (@{n.line}:{n.col})\n"
-                + format_node(n.left, indent + 1)
-                + "\n"
-                + format_node(n.right, indent + 1)
-            )
-        if isinstance(n, Number):
-            return pad + f"Number {n.value} (@{n.line}:{n.col})"
-        if isinstance(n, String):
-            return pad + f"String {n.value!r} (@{n.line}:{n.col})"
-        if isinstance(n, Var):
-            return pad + f"Var {n.name} (@{n.line}:{n.col})"
-        return pad + repr(n)
-
-    if prog:
-        # very simple AST: one readable line per statement, indented for blocks
-        def expr_repr(e):
-            opmap = {
-                "PLUS": "+",
-                "MINUS": "-",
-                "TIMES": "*",
-                "DIV": "/",
-                "EQ": "==",
-                "NE": "!=",
-                "LT": "<",
-                "GT": ">",
-                "LE": "<=",
-                "GE": ">=",
-                "AND": "and",
-                "OR": "or",
-            }
-            if isinstance(e, Number):
-                return str(e.value)
-            if isinstance(e, String):
-                return f'"{e.value}"'
-            if isinstance(e, Var):
-                return e.name
-            if isinstance(e, BinOp):
-                left = expr_repr(e.left)
-                right = expr_repr(e.right)
-                sym = opmap.get(e.op, e.op)
-                return f"{left} {sym} {right}"
-            return repr(e)
-
-        def simple_ast(n, indent=0):
-            pad = "  " * indent
-            if isinstance(n, Program):
-                lines = []
-                for s in n.stmts:
-                    lines.append(simple_ast(s, indent))
-                return "\n".join(lines)
-            if isinstance(n, Step):
-                return pad + f"Step {n.name}"
-            if isinstance(n, Goto):
-                return pad + f"Goto {n.target}"
-            if isinstance(n, Print):
-                return pad + f"Print {expr_repr(n.expr)}"
-            if isinstance(n, Assign):
-                return pad + f"{n.name} = {expr_repr(n.expr)}"
-            if isinstance(n, Repeat):
-                lines = [pad + f"Repeat {n.count} times"]
-                for s in n.block:
-                    lines.append(simple_ast(s, indent + 1))
-                return "\n".join(lines)
-            if isinstance(n, If):
-                lines = [pad + f"If {expr_repr(n.cond)}"]
-                for s in n.block:
-                    lines.append(simple_ast(s, indent + 1))
-                return "\n".join(lines)
-            return pad + repr(n)
-
-        print(simple_ast(prog))
+        f.write("(no instructions removed)\n")
+
+
+def _report_code(f, r):
+    if r["prog"]:
+        simple_ast(r["prog"], write=f.write)
+        f.write("\n")
+    else:
+        f.write("(no AST)\n")
+
+
+def _report_ast(f, r):
+    if r["prog"]:
+        format_node(r["prog"], write=f.write)
+        f.write("\n")
+    else:
+        f.write("(no AST)\n")
+
+
+# report sections for --emit: name -> (header, what compile_and_run must
+# keep for it, writer(f, results by name)); "output" is the program output
+REPORTS = {
+    "tac": ("TAC", "tac", _report_tac),
+    "opt": ("OPT TAC", "opt", _report_opt),
+    "symbols": ("SYMBOL TABLE", None, _report_symbols),
+    "diagnostics": ("DIAGNOSTICS", None, _report_diagnostics),
+    "dce": ("DCE REMOVED", "removed", _report_dce),
+    "code": ("CODE", "ast", _report_code),
+    "ast": ("AST", "ast", _report_ast),
+}
+# sections written without --emit
+DEFAULT_EMIT = ["output", "tac", "opt", "symbols", "diagnostics", "dce", "code"]
+RESULTS = ("out", "tac", "opt", "st", "diagnostics", "removed", "prog", "linked")
+
+
+def _discard(line):
+    pass
+
+
+def _binding(text):
+    # --bind NAME=VALUE: an int when VALUE is one, else the string
+    name, sep, value = text.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    try:
+        return name, int(value)
+    except ValueError:
+        return name, value
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compile and run a MiniFlow program")
+    ap.add_argument("file", nargs="?")
+    ap.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        default="tac",
+        help="tac: TAC interpreter, pyc: compiled Python function",
+    )
+    ap.add_argument("--cache-dir", help="reuse compiled .mfc modules from DIR")
+    ap.add_argument(
+        "--cache-max-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="evict least recently used modules beyond this total size",
+    )
+    ap.add_argument(
+        "--cache-stats", action="store_true", help="print cache statistics and exit"
+    )
+    ap.add_argument(
+        "--flush-lines",
+        type=int,
+        default=1024,
+        help="flush program output after this many lines",
+    )
+    ap.add_argument(
+        "--batch",
+        nargs="+",
+        metavar="PATH",
+        help="run every .mf file in these directories/globs/files over a process pool",
+    )
+    ap.add_argument(
+        "-j", "--jobs", type=int, default=None, help="batch worker processes"
+    )
+    ap.add_argument("--out-dir", help="batch: write each file's output to DIR")
+    ap.add_argument("--summary-json", help="batch: write per-file results as JSON")
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="count and time every instruction; report hot steps and lines",
+    )
+    ap.add_argument("--profile-json", help="--profile: also write the profile as JSON")
+    ap.add_argument(
+        "--timings",
+        action="store_true",
+        help="report time, peak memory and object counts per compiler phase",
+    )
+    ap.add_argument(
+        "--timings-json", help="--timings: also write the records as JSON lines"
+    )
+    ap.add_argument(
+        "--emit",
+        help="comma-separated report sections to write, in order: output, "
+        + ", ".join(REPORTS)
+        + f" (default: {','.join(DEFAULT_EMIT)})",
+    )
+    ap.add_argument(
+        "--lean",
+        action="store_true",
+        help="production run: program output only (--emit=output), keeping no "
+        "intermediate representation alive",
+    )
+    ap.add_argument(
+        "--checkpoint-dir",
+        help="run with checkpoints in DIR; continue later with --resume DIR",
+    )
+    ap.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=100000,
+        help="checkpoint: instructions between checks for a due checkpoint",
+    )
+    ap.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=1.0,
+        help="checkpoint: least seconds between two checkpoints",
+    )
+    ap.add_argument(
+        "--checkpoint-at-steps",
+        action="store_true",
+        help="checkpoint: take checkpoints when control reaches a step",
+    )
+    ap.add_argument(
+        "--resume",
+        metavar="DIR",
+        help="continue the checkpointed run in DIR (no source file needed)",
+    )
+    ap.add_argument(
+        "--daemon",
+        action="store_true",
+        help="serve JSON-line run requests on stdin/stdout or --socket (see daemon.py)",
+    )
+    ap.add_argument("--socket", help="daemon: listen on this Unix socket")
+    ap.add_argument(
+        "--max-programs",
+        type=int,
+        default=256,
+        help="daemon: compiled programs kept in memory",
+    )
+    ap.add_argument(
+        "--frontend-jobs",
+        type=int,
+        metavar="N",
+        help="lex, parse and lower the file's steps in N worker processes "
+        "(with --lean or --emit without ast; pays off on N idle cores)",
+    )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        help="recompile step by step and rerun whenever the file changes",
+    )
+    ap.add_argument(
+        "--bind",
+        action="append",
+        type=_binding,
+        metavar="NAME=VALUE",
+        help="start the run with variable NAME set to VALUE (repeatable); "
+        "compiles without assuming variables start at 0 and skips the cache",
+    )
+    args = ap.parse_args()
+    bindings = dict(args.bind) if args.bind else None
+    if bindings is not None:
+        if args.batch or args.daemon or args.resume or args.checkpoint_dir or args.watch:
+            ap.error("--bind applies to a single run of a file")
+        if args.backend != "tac":
+            ap.error("--bind runs the TAC interpreter; drop --backend")
+    cache = None
+    if args.cache_dir:
+        cache = ModuleCache(args.cache_dir, args.cache_max_bytes)
+    if args.cache_stats:
+        if cache is None:
+            ap.error("--cache-stats requires --cache-dir")
+        for k, v in cache.stats().items():
+            print(f"{k} : {v}")
+        sys.exit(0)
+    if args.batch:
+        import json
+        from batch import run_batch, summary, write_report
+
+        start = time.perf_counter()
+        results = run_batch(args.batch, args.jobs, args.backend)
+        wall = time.perf_counter() - start
+        for r in results:
+            if args.out_dir:
+                os.makedirs(args.out_dir, exist_ok=True)
+                name = r["path"].strip(os.sep).replace(os.sep, "__") + ".out"
+                with open(os.path.join(args.out_dir, name), "w") as f:
+                    write_report(r, f)
+            else:
+                print(f"=== {r['path']} [{r['status']}] ===")
+                write_report(r, sys.stdout)
+                print()
+        print(summary(results, wall))
+        if args.summary_json:
+            with open(args.summary_json, "w") as f:
+                json.dump({"wall": wall, "results": results}, f, indent=2)
+        sys.exit(1 if any(r["status"] in ("error", "crashed") for r in results) else 0)
+    if args.daemon:
+        from daemon import Daemon
+
+        daemon = Daemon(args.jobs, args.max_programs)
+        try:
+            if args.socket:
+                daemon.serve_socket(args.socket)
+            else:
+                daemon.serve_stdio()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.resume or args.checkpoint_dir:
+        from checkpoint import CheckpointError, Checkpointer
+
+        if args.backend != "tac":
+            ap.error("checkpointed runs use the TAC interpreter; drop --backend")
+        if args.checkpoint_dir and not args.file:
+            ap.error("--checkpoint-dir needs a file to run")
+        ckpt = Checkpointer(
+            args.resume or args.checkpoint_dir,
+            args.checkpoint_every,
+            args.checkpoint_interval,
+            args.checkpoint_at_steps,
+        )
+        saved = None
+        try:
+            if args.resume:
+                mod, saved = ckpt.load()
+            else:
+                with open(args.file) as f:
+                    mod = compile_module(f.read())
+                ckpt.start(mod)
+        except CheckpointError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        for d in mod.diagnostics:
+            print("ERROR:", d, file=sys.stderr)
+        linked = link(mod.tac, mod.st)
+        if saved is not None and saved["pc"] >= len(linked):
+            print("(run already finished)", file=sys.stderr)
+        # output only: what was written before the checkpoint is not repeated
+        sink = FileSink(sys.stdout, flush_lines=args.flush_lines)
+        try:
+            ckpt.run(linked, sink, mod.st, saved)
+        finally:
+            sink.flush()
+        sys.exit(0)
+    if not args.file:
+        ap.error("the following arguments are required: file")
+    if args.watch:
+        try:
+            watch(args.file, args.backend, flush_lines=args.flush_lines)
+        except KeyboardInterrupt:
+            sys.exit(0)
+    profile = Profile() if args.profile or args.profile_json else None
+    if profile is not None and args.backend != "tac":
+        ap.error("--profile runs the TAC interpreter; drop --backend")
+    telemetry = Telemetry() if args.timings or args.timings_json else None
+    emit = ["output"] if args.lean else None
+    if args.emit:
+        emit = [name for name in args.emit.split(",") if name]
+        unknown = [name for name in emit if name != "output" and name not in REPORTS]
+        if unknown:
+            ap.error(f"--emit: unknown section(s) {', '.join(unknown)}")
+    sections = emit or DEFAULT_EMIT
+    headers = emit is None or len(emit) > 1
+    keep = None
+    if emit is not None:
+        keep = {REPORTS[name][1] for name in emit if name in REPORTS}
+    if args.frontend_jobs and (keep is None or "ast" in keep):
+        # shipping the ASTs back costs more than the workers save
+        ap.error("--frontend-jobs needs --lean or an --emit without ast")
+    if emit is None or cache is not None or args.frontend_jobs:
+        code = open(args.file).read()
+    else:
+        # tokenized while it is read: the source text is never held whole
+        code = open(args.file)
+    if "output" in sections:
+        # program output is streamed to stdout while it runs
+        if headers:
+            print("=== OUTPUT ===")
+        sys.stdout.flush()
+        sink = FileSink(sys.stdout, flush_lines=args.flush_lines)
     else:
-        print("(no AST)")
-    print()
-    print()
+        sink = CallbackSink(_discard)
+
+    def flush_output():
+        if "output" in sections:
+            sink.flush()
+
+    frontend = None
+    if args.frontend_jobs:
+        from frontend import FrontEnd
+
+        frontend = FrontEnd(args.frontend_jobs)
+    try:
+        results = compile_and_run(
+            code, args.backend, cache, sink, profile, telemetry, keep, frontend, bindings
+        )
+    finally:
+        if frontend is not None:
+            frontend.close()
+        if cache is not None:
+            cache.close()
+        # reported even when the workflow fails part way
+        flush_output()
+        if profile is not None and profile.linked is not None:
+            print()
+            print("=== PROFILE ===")
+            print(profile.report())
+            if args.profile_json:
+                with open(args.profile_json, "w") as f:
+                    profile.dump(f)
+        if telemetry is not None:
+            telemetry.close()
+            print()
+            print("=== TIMINGS ===")
+            print(telemetry.summary())
+            if args.timings_json:
+                with open(args.timings_json, "w") as f:
+                    telemetry.dump(f)
+    r = dict(zip(RESULTS, results))
+    results = None
+    if headers and "output" in sections:
+        print()
+    if "diagnostics" not in sections:
+        for d in r["diagnostics"]:
+            print("ERROR:", d, file=sys.stderr)
+    # sections are written straight to stdout as they are produced
+    for name in sections:
+        if name == "output":
+            continue
+        title, _, write = REPORTS[name]
+        if headers:
+            sys.stdout.write(f"=== {title} ===\n")
+        write(sys.stdout, r)
+        if headers:
+            sys.stdout.write("\n")
+    if emit is None:
+        print()
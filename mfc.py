@@ -0,0 +1,308 @@
+# Compiled-module (.mfc) format and the on-disk cache built on it.
+#
+# Layout (little endian):
+#   header   magic "MFC", format version u8, compiler version (32 bytes)
+#   pool     u32 count, then per entry a tag u8 and its payload:
+#              str   u32 length + utf-8 bytes
+#              int   i64            bigint  u32 length + two's complement
+#              true / false / none  (no payload)
+#   code     u32 count, then per instruction: opcode u8, a/b/c pool refs u32,
+#            has-src u8, line i32, col i32 (-1 when unknown)
+#   symbols  u32 count, then (name ref u32, type ref u32)
+#   diags    u32 count, then message ref u32
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from ir import TACInstr
+from semantic import SymbolTable
+
+MAGIC = b"MFC"
+FORMAT_VERSION = 2
+# codegen is hashed too: checkpoints (checkpoint.py) hold the linked slot
+# indexes and pc of the stored program
+COMPILER_MODULES = ("lexer", "parser", "ast", "semantic", "ir", "optimizer", "codegen")
+OPNAMES = ("label", "goto", "print", "assign", "binop", "if_gt", "if_false")
+OPCODES = {name: i for i, name in enumerate(OPNAMES)}
+
+T_STR, T_INT, T_BIGINT, T_TRUE, T_FALSE, T_NONE = range(6)
+
+HEADER = struct.Struct("<3sB32s")
+U32 = struct.Struct("<I")
+I64 = struct.Struct("<q")
+INSTR = struct.Struct("<BIIIBii")
+PAIR = struct.Struct("<II")
+
+
+class FormatError(Exception):
+    pass
+
+
+def compiler_version():
+    # hash of the compiler sources: any change there invalidates every
+    # cached module and checkpoint
+    h = hashlib.sha256(bytes([FORMAT_VERSION]))
+    here = os.path.dirname(os.path.abspath(__file__))
+    for mod in COMPILER_MODULES:
+        with open(os.path.join(here, mod + ".py"), "rb") as f:
+            h.update(f.read())
+    return h.digest()
+
+
+class Module:
+    # what a cache hit hands back in place of the front end + optimizer
+    def __init__(self, tac, st, diagnostics):
+        self.tac = tac
+        self.st = st
+        self.diagnostics = diagnostics
+
+
+def encode_value(v):
+    # one tagged constant (a pool entry; also used for checkpointed frames)
+    if v is None:
+        return bytes([T_NONE])
+    if v is True:
+        return bytes([T_TRUE])
+    if v is False:
+        return bytes([T_FALSE])
+    if isinstance(v, int):
+        if -(2**63) <= v < 2**63:
+            return bytes([T_INT]) + I64.pack(v)
+        # little endian, signed; str() refuses ints over 4300 digits
+        b = v.to_bytes(v.bit_length() // 8 + 1, "little", signed=True)
+        return bytes([T_BIGINT]) + U32.pack(len(b)) + b
+    if isinstance(v, str):
+        b = v.encode("utf-8")
+        return bytes([T_STR]) + U32.pack(len(b)) + b
+    raise FormatError(f"Cannot encode operand {v!r}")
+
+
+def decode_value(buf, off):
+    # -> (value, offset after it)
+    tag = buf[off]
+    off += 1
+    if tag == T_INT:
+        return I64.unpack_from(buf, off)[0], off + 8
+    if tag == T_STR or tag == T_BIGINT:
+        (size,) = U32.unpack_from(buf, off)
+        b = bytes(buf[off + 4 : off + 4 + size])
+        if tag == T_BIGINT:
+            return int.from_bytes(b, "little", signed=True), off + 4 + size
+        return b.decode("utf-8"), off + 4 + size
+    return {T_TRUE: True, T_FALSE: False, T_NONE: None}[tag], off
+
+
+def dumps(mod, version):
+    pool = {}
+    entries = []
+
+    def ref(v):
+        key = (type(v), v)
+        if key not in pool:
+            pool[key] = len(entries)
+            entries.append(v)
+        return pool[key]
+
+    code = []
+    for instr in mod.tac:
+        if instr.op not in OPCODES:
+            raise FormatError(f"Cannot encode TAC op {instr.op}")
+        line, col = instr.src if instr.src else (None, None)
+        code.append(
+            INSTR.pack(
+                OPCODES[instr.op],
+                ref(instr.a),
+                ref(instr.b),
+                ref(instr.c),
+                instr.src is not None,
+                -1 if line is None else line,
+                -1 if col is None else col,
+            )
+        )
+    symbols = [PAIR.pack(ref(k), ref(v)) for k, v in mod.st.items()]
+    diags = [U32.pack(ref(d)) for d in mod.diagnostics]
+
+    out = [HEADER.pack(MAGIC, FORMAT_VERSION, version), U32.pack(len(entries))]
+    out.extend(encode_value(v) for v in entries)
+    for part in (code, symbols, diags):
+        out.append(U32.pack(len(part)))
+        out.extend(part)
+    return b"".join(out)
+
+
+def loads(buf, version=None):
+    # buf is anything supporting the buffer protocol (bytes or an mmap)
+    if len(buf) < HEADER.size:
+        raise FormatError("Truncated module")
+    magic, fmt, ver = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or fmt != FORMAT_VERSION:
+        raise FormatError("Not a MiniFlow module")
+    if version is not None and ver != version:
+        raise FormatError("Module built by another compiler version")
+    off = HEADER.size
+    try:
+        (n,) = U32.unpack_from(buf, off)
+        off += 4
+        pool = []
+        for _ in range(n):
+            v, off = decode_value(buf, off)
+            pool.append(v)
+        (n,) = U32.unpack_from(buf, off)
+        off += 4
+        tac = []
+        for _ in range(n):
+            op, a, b, c, has_src, line, col = INSTR.unpack_from(buf, off)
+            off += INSTR.size
+            instr = TACInstr(OPNAMES[op], pool[a], pool[b], pool[c])
+            if has_src:
+                instr.src = (None if line < 0 else line, None if col < 0 else col)
+            tac.append(instr)
+        (n,) = U32.unpack_from(buf, off)
+        off += 4
+        st = SymbolTable()
+        for _ in range(n):
+            k, v = PAIR.unpack_from(buf, off)
+            off += PAIR.size
+            st.declare(pool[k], pool[v])
+        (n,) = U32.unpack_from(buf, off)
+        off += 4
+        diagnostics = []
+        for _ in range(n):
+            diagnostics.append(pool[U32.unpack_from(buf, off)[0]])
+            off += 4
+    except (struct.error, IndexError, KeyError, UnicodeDecodeError) as e:
+        raise FormatError(f"Corrupt module: {e}")
+    return Module(tac, st, diagnostics)
+
+
+def load(path, version=None):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return loads(mm, version)
+
+
+class ModuleCache:
+    # directory of <sha256(compiler version + source)>.mfc files, evicted
+    # least-recently-used first once their total size exceeds max_bytes.
+    # Hit/miss counters are kept in memory and appended to STATS as one
+    # JSON line of increments at flush() (and close(), or the end of a with
+    # block); an O_APPEND write that small is not interleaved, so concurrent
+    # processes lose no counts.
+    STATS = "stats.jsonl"
+    COUNTERS = ("hits", "misses", "stores", "evictions")
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = compiler_version()
+        self.pending = dict.fromkeys(self.COUNTERS, 0)
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, code):
+        h = hashlib.sha256(self.version)
+        h.update(code.encode("utf-8"))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".mfc")
+
+    def get(self, code):
+        path = self.path(self.key(code))
+        try:
+            mod = load(path, self.version)
+        except (OSError, ValueError, FormatError):
+            # missing, empty (mmap refuses length 0) or stale/corrupt
+            self.bump("misses")
+            return None
+        os.utime(path)  # recency for eviction
+        self.bump("hits")
+        return mod
+
+    def put(self, code, mod):
+        path = self.path(self.key(code))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(dumps(mod, self.version))
+        os.replace(tmp, path)
+        self.bump("stores")
+        self.evict()
+
+    def entries(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".mfc"):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                found.append((st.st_mtime, st.st_size, name))
+        return found
+
+    def evict(self):
+        found = sorted(self.entries())
+        total = sum(size for _, size, _ in found)
+        evicted = 0
+        while found and total > self.max_bytes:
+            _, size, name = found.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        if evicted:
+            self.bump("evictions", evicted)
+
+    def counters(self):
+        # flushed increments of every process, plus this one's pending ones
+        counters = dict(self.pending)
+        try:
+            with open(os.path.join(self.directory, self.STATS)) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn by a crash mid-write
+                    for k in self.COUNTERS:
+                        counters[k] += record.get(k, 0)
+        except OSError:
+            pass
+        return counters
+
+    def stats(self):
+        stats = self.counters()
+        found = self.entries()
+        stats["modules"] = len(found)
+        stats["bytes"] = sum(size for _, size, _ in found)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def bump(self, counter, n=1):
+        self.pending[counter] += n
+
+    def flush(self):
+        # append the pending increments in a single write
+        if not any(self.pending.values()):
+            return
+        line = (json.dumps(self.pending) + "\n").encode()
+        fd = os.open(
+            os.path.join(self.directory, self.STATS),
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o644,
+        )
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self.pending = dict.fromkeys(self.COUNTERS, 0)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,51 +1,844 @@
 from ir import TACInstr
+from codegen import operand, OPS, CONST, TEMP_NAME
+from functools import lru_cache
+import heapq
+import time
 
+JUMPS = ("goto", "if_gt", "if_false")
+# operators that apply int() to both operands and so fail on other strings
+RAISING = {"+", "-", "*", "/", ">", "<", ">=", "<="}
 
-def constant_folding(code):
-    new = []
-    for instr in code:
-        if instr.op == "binop" and isinstance(instr.b, str):
-            parts = instr.b.split()
+# Lattice of values: (type, value) for a known constant, NUM for a value
+# that is not constant but is an int or a bool (int() cannot fail on it),
+# NAC for anything at all. Every variable and temp starts out as 0.
+#
+# Every pass takes `entries`: None for a whole program, or the step labels
+# of a piece of one (incremental.py compiles each step on its own). A piece
+# may be entered at its start or at any of those labels with nothing known,
+# leaves by falling off its end or by a goto to a label it does not define,
+# and every name it writes may be read after it. entries=() is a whole
+# program whose variables may start with any value (codegen.bind).
+NUM = "num"
+NAC = "nac"
+ZERO = (int, 0)
+# folded ints bigger than this stay runtime computations
+FOLD_BITS = 4096
+# work budget of the global analyses, per instruction and block of the code
+# (instructions and per-name facts visited) but at least GLOBAL_FLOOR, so
+# that the optimizer stays linear in the program size; past it, or when
+# loop_depth predicts it would be passed, every block is optimized on its
+# own. The loop passes get LOOP_WORK rescanned body instructions per
+# instruction.
+GLOBAL_WORK = 32
+GLOBAL_FLOOR = 1 << 15
+LOOP_WORK = 8
+# the dataflow rounds stop once one changes (removes or rewrites) fewer than
+# 1 in ROUND_GAIN instructions: what is left is a tail of small clean-ups,
+# such as one dead store per round, not worth a pass over the code each
+ROUND_GAIN = 100
+
+# the same few operand spellings are classified over and over
+operand = lru_cache(maxsize=1 << 16, typed=True)(operand)
+
+
+class Block:
+    # basic block code[start:end]; succ/pred hold block indices
+    __slots__ = ("start", "end", "succ", "pred")
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.succ = []
+        self.pred = []
+
+
+def branch_target(instr):
+    # label a jump refers to, resolved the way codegen.decode does
+    if instr.op == "goto":
+        return instr.a
+    if instr.op == "if_gt":
+        if isinstance(instr.c, str) and instr.c.startswith("goto "):
+            return instr.c.split()[1]
+        return None
+    if instr.op == "if_false":
+        return instr.b
+    return None
+
+
+def build_cfg(code):
+    # blocks start at labels and after jumps; an unknown branch target
+    # falls through and a goto to an unknown label has no successor
+    labels = {}
+    starts = {0}
+    for i, instr in enumerate(code):
+        if instr.op == "label":
+            labels[instr.a] = i
+            starts.add(i)
+        elif instr.op in JUMPS:
+            starts.add(i + 1)
+    starts = sorted(s for s in starts if s < len(code))
+    index = {s: n for n, s in enumerate(starts)}
+    ends = starts[1:] + [len(code)]
+    blocks = [Block(s, e) for s, e in zip(starts, ends)]
+    for n, b in enumerate(blocks):
+        last = code[b.end - 1]
+        target = branch_target(last)
+        if target in labels:
+            b.succ.append(index[labels[target]])
+        if last.op != "goto" and n + 1 < len(blocks):
+            b.succ.append(n + 1)
+        for s in b.succ:
+            blocks[s].pred.append(n)
+    return blocks, labels
+
+
+def loop_depth(blocks):
+    # deepest nesting of back edges (jumps to the same or an earlier block)
+    diff = [0] * (len(blocks) + 1)
+    for n, b in enumerate(blocks):
+        for s in b.succ:
+            if s <= n:
+                diff[s] += 1
+                diff[n + 1] -= 1
+    depth = deepest = 0
+    for d in diff:
+        depth += d
+        deepest = max(deepest, depth)
+    return deepest
+
+
+def global_budget(code, blocks, tracked):
+    # work a global analysis may spend, or None when it should not start:
+    # it visits every block about loop_depth + 2 times, each visit handling
+    # the block's instructions and up to `tracked` facts
+    budget = max(GLOBAL_FLOOR, GLOBAL_WORK * (len(code) + len(blocks)))
+    visits = loop_depth(blocks) + 2
+    if visits * (len(code) + len(blocks) * tracked) > budget:
+        return None
+    return budget
+
+
+def names_of(instr):
+    # (names read, name written) by a TAC instruction
+    op = instr.op
+    if op == "binop":
+        parts = instr.b.split()
+        reads = (parts[0], parts[2]) if len(parts) == 3 else ()
+        return [x for x in reads if operand(x)[0] != CONST], instr.a
+    if op == "assign":
+        return [x for x in (instr.b,) if operand(x)[0] != CONST], instr.a
+    if op in ("print", "if_gt", "if_false"):
+        return [x for x in (instr.a,) if operand(x)[0] != CONST], None
+    return [], None
+
+
+def block_uses(code, blocks):
+    # per block: names read before being written in it, and names written;
+    # the union of the former is every name whose value crosses blocks
+    uses, defs = [], []
+    for b in blocks:
+        use, d = set(), set()
+        for instr in code[b.start : b.end]:
+            reads, dest = names_of(instr)
+            use.update(x for x in reads if x not in d)
+            if dest is not None:
+                d.add(dest)
+        uses.append(use)
+        defs.append(d)
+    return uses, defs, set().union(*uses)
+
+
+def _numeric(v):
+    return v == NUM or (isinstance(v, tuple) and v[0] in (int, bool))
+
+
+def _meet(a, b):
+    if a == b:
+        return a
+    if _numeric(a) and _numeric(b):
+        return NUM
+    return NAC
+
+
+def _const_text(v):
+    # spelling of a constant inside binop text, None if it has none there
+    if type(v) is int:
+        try:
+            return str(v)
+        except ValueError:  # past the int -> str digit limit
+            return None
+    if type(v) is str:
+        text = f'"{v}"'
+        if text.split() == [text]:
+            return text
+    return None
+
+
+def _const_operand(v):
+    # operand of assign/print/branches standing for the constant v
+    return f'"{v}"' if isinstance(v, str) else v
+
+
+class Facts:
+    # what is known at one program point: lattice values by name (missing
+    # names have `default`) and copies (x -> y: x holds the value of y).
+    # Only names in `exact` or in vals are tracked across blocks; others
+    # are always written in a block before being read.
+    __slots__ = ("vals", "copies", "rev", "default", "exact")
+
+    def __init__(self, vals, copies, default, exact=()):
+        self.vals = vals
+        self.copies = copies
+        self.default = default
+        self.exact = exact
+        self.rev = {}
+        for x, y in copies.items():
+            self.rev.setdefault(y, set()).add(x)
+
+    def copy(self):
+        return Facts(dict(self.vals), dict(self.copies), self.default, self.exact)
+
+    def value(self, name):
+        return self.vals.get(name, self.default)
+
+    def source(self, name):
+        return self.copies.get(name, name)
+
+    def define(self, name, value, source=None):
+        old = self.copies.pop(name, None)
+        if old is not None:
+            self.rev[old].discard(name)
+        for x in self.rev.pop(name, ()):
+            del self.copies[x]
+        self.vals[name] = value
+        if source is not None and source != name:
+            self.copies[name] = source
+            self.rev.setdefault(source, set()).add(name)
+
+    def restrict(self, keep):
+        # facts about the names in `keep` only, defaults left implicit
+        vals = {k: v for k, v in self.vals.items() if k in keep and v != self.default}
+        copies = {x: y for x, y in self.copies.items() if x in keep and y in keep}
+        return Facts(vals, copies, self.default, self.exact)
+
+    def meet(self, other):
+        vals = {}
+        for k in self.vals.keys() | other.vals.keys():
+            v = _meet(self.value(k), other.value(k))
+            if v != self.default:
+                vals[k] = v
+        copies = {x: y for x, y in self.copies.items() if other.copies.get(x) == y}
+        return Facts(vals, copies, self.default, self.exact)
+
+    def holds(self, name, value):
+        # is `value` known to be what name holds already?
+        return (name in self.vals or name in self.exact) and self.value(name) == value
+
+    def same(self, other):
+        return self.vals == other.vals and self.copies == other.copies
+
+
+def _operand_fact(x, facts):
+    # (value, rewritten operand) for an assign/print/branch operand
+    kind, v = operand(x)
+    if kind == CONST:
+        return (type(v), v), x
+    src = facts.source(v)
+    val = facts.value(src)
+    if isinstance(val, tuple):
+        return val, _const_operand(val[1])
+    return val, src
+
+
+def _part_fact(x, facts):
+    # (value, rewritten text) for one operand of binop text
+    kind, v = operand(x)
+    if kind == CONST:
+        return (type(v), v), x
+    src = facts.source(v)
+    val = facts.value(src)
+    if isinstance(val, tuple):
+        text = _const_text(val[1])
+        if text is not None:
+            return val, text
+    return val, src
+
+
+def _fold(sym, a, b):
+    # value of `a sym b` when it is a known constant, with codegen.OPS
+    fn = OPS.get(sym)
+    if fn is None:
+        return ZERO  # codegen._unknown_op
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        try:
+            v = fn(a[1], b[1])
+        except Exception:  # fails at run time as well; leave it there
+            return None
+        if type(v) is int and v.bit_length() > FOLD_BITS:
+            return None
+        return (type(v), v)
+    if sym == "and" and any(isinstance(x, tuple) and not x[1] for x in (a, b)):
+        return (bool, False)
+    if sym == "or" and any(isinstance(x, tuple) and x[1] for x in (a, b)):
+        return (bool, True)
+    return None
+
+
+def _same(x, y):
+    return type(x) is type(y) and x == y
+
+
+def _rewrite(instr, op, a, b=None, c=None):
+    if op == instr.op and _same(a, instr.a) and _same(b, instr.b) and _same(c, instr.c):
+        return instr
+    new = TACInstr(op, a, b, c)
+    new.src = instr.src
+    return new
+
+
+def _branch(instr, taken, labels):
+    # a branch with a known outcome: a goto when taken, nothing otherwise
+    target = branch_target(instr)
+    if taken and target in labels:
+        return _rewrite(instr, "goto", target)
+    return None
+
+
+def _transfer(instr, facts, labels):
+    # Abstractly execute one instruction: update facts and return the
+    # rewritten instruction (None when it can be dropped) and whether it is
+    # known not to raise.
+    op = instr.op
+    if op == "print":
+        _, a = _operand_fact(instr.a, facts)
+        return _rewrite(instr, op, a), True
+    if op == "assign":
+        val, b = _operand_fact(instr.b, facts)
+        if isinstance(val, tuple) and facts.holds(instr.a, val):
+            return None, True
+        kind, name = operand(b)
+        facts.define(instr.a, val, None if kind == CONST else name)
+        return _rewrite(instr, op, instr.a, b), True
+    if op == "binop":
+        parts = instr.b.split()
+        if len(parts) != 3:
+            facts.define(instr.a, (str, instr.b))
+            return instr, True
+        a_val, a = _part_fact(parts[0], facts)
+        b_val, b = _part_fact(parts[2], facts)
+        sym = parts[1]
+        res = _fold(sym, a_val, b_val)
+        if res is not None:
+            facts.define(instr.a, res)
+            return _rewrite(instr, "assign", instr.a, _const_operand(res[1])), True
+        facts.define(instr.a, NUM)
+        safe = sym not in RAISING or (_numeric(a_val) and _numeric(b_val))
+        if [a, sym, b] == parts:
+            return instr, safe
+        return _rewrite(instr, op, instr.a, f"{a} {sym} {b}", instr.c), safe
+    if op == "if_gt":
+        val, a = _operand_fact(instr.a, facts)
+        if isinstance(val, tuple):
             try:
-                a = int(parts[0])
-                op = parts[1]
-                b = int(parts[2])
-                if op == "+":
-                    res = a + b
-                elif op == "-":
-                    res = a - b
-                elif op == "*":
-                    res = a * b
-                elif op == "/":
-                    res = a // b if b != 0 else a // 1
-                else:
-                    new.append(instr)
-                    continue
-                new.append(TACInstr("assign", instr.a, res))
+                taken = int(val[1]) > int(instr.b)
             except Exception:
-                new.append(instr)
-        else:
-            new.append(instr)
-    return new
+                taken = None
+            if taken is not None:
+                return _branch(instr, taken, labels), True
+        return _rewrite(instr, op, a, instr.b, instr.c), _numeric(val)
+    if op == "if_false":
+        val, a = _operand_fact(instr.a, facts)
+        if isinstance(val, tuple):
+            return _branch(instr, not val[1], labels), True
+        return _rewrite(instr, op, a, instr.b), True
+    return instr, True
 
 
-def dead_code_elim(code):
-    # very naive: remove assignments to temps that are never used
-    used = set()
+def _roots(blocks, labels, entries):
+    # blocks control can enter from outside the code
+    if not blocks:
+        return []
+    if entries is None:
+        return [0]
+    at = {b.start: n for n, b in enumerate(blocks)}
+    return sorted({0} | {at[labels[x]] for x in entries if x in labels})
+
+
+def _forward(code, blocks, labels, crossing, entries=None):
+    # facts at the entry of every block (None: never reached)
+    budget = global_budget(code, blocks, len(crossing))
+    if budget is None:
+        return [Facts({}, {}, NAC) for _ in blocks]
+    ins = [None] * len(blocks)
+    work = _roots(blocks, labels, entries)
+    for n in work:
+        ins[n] = Facts({}, {}, ZERO if entries is None else NAC, crossing)
+    queued = set(work)
+    while work:
+        n = heapq.heappop(work)
+        queued.discard(n)
+        b = blocks[n]
+        budget -= b.end - b.start + len(ins[n].vals) + len(ins[n].copies)
+        if budget < 0:
+            return [Facts({}, {}, NAC) for _ in blocks]
+        facts = ins[n].copy()
+        for instr in code[b.start : b.end]:
+            _transfer(instr, facts, labels)
+        out = facts.restrict(crossing)
+        for s in b.succ:
+            new = out if ins[s] is None else ins[s].meet(out)
+            if ins[s] is None or not new.same(ins[s]):
+                ins[s] = new
+                if s not in queued:
+                    queued.add(s)
+                    heapq.heappush(work, s)
+    return ins
+
+
+def constant_folding(code, entries=None):
+    # Global constant and copy propagation on the CFG: operands known to be
+    # constants or copies are substituted, binops with constant results
+    # become assigns, branches with known outcomes become gotos (or
+    # disappear) and stores of the value a name already holds are dropped.
+    # Returns (code, safe, dropped): `safe` holds the binops and if_gts
+    # that cannot raise, `dropped` the instructions removed.
+    blocks, labels = build_cfg(code)
+    crossing = block_uses(code, blocks)[2]
+    ins = _forward(code, blocks, labels, crossing, entries)
+    new, safe, dropped = [], set(), []
+    for b, facts in zip(blocks, ins):
+        if facts is None:
+            new.extend(code[b.start : b.end])
+            continue
+        facts = facts.copy()  # successors may share one entry state
+        for instr in code[b.start : b.end]:
+            out, ok = _transfer(instr, facts, labels)
+            if out is None:
+                dropped.append(instr)
+                continue
+            new.append(out)
+            if ok:
+                safe.add(out)
+    return new, safe, dropped
+
+
+def _liveness(blocks, uses, defs, exits, budget):
+    # names live at the exit of every block, or None past `budget` (see
+    # global_budget); exits: {block: names live after it leaves the code}
+    if budget is None:
+        return None
+    ins = [set() for _ in blocks]
+    outs = [set() for _ in blocks]
+    work = list(range(len(blocks)))
+    queued = set(work)
+    while work:
+        n = work.pop()
+        queued.discard(n)
+        out = set(exits.get(n, ()))
+        for s in blocks[n].succ:
+            out |= ins[s]
+        budget -= len(out) + 1
+        if budget < 0:
+            return None
+        outs[n] = out
+        live = uses[n] | (out - defs[n])
+        if live != ins[n]:
+            ins[n] = live
+            for p in blocks[n].pred:
+                if p not in queued:
+                    queued.add(p)
+                    work.append(p)
+    return outs
+
+
+def _removable(instr, safe):
+    if instr.op == "assign":
+        return True
+    if instr.op == "binop":
+        parts = instr.b.split()
+        return len(parts) != 3 or parts[1] not in RAISING or instr in safe
+    return False
+
+
+def dead_code_elim(code, safe=(), entries=None):
+    # Liveness-based dead store elimination, removal of unreachable code and
+    # of jumps to the instruction that follows anyway. Binops and if_gts
+    # that may raise are only removed when listed in `safe`.
+    blocks, labels = build_cfg(code)
+    uses, defs, crossing = block_uses(code, blocks)
+    exits = {}
+    if entries is not None:
+        crossing = crossing.union(*defs)
+        for n, b in enumerate(blocks):
+            last = code[b.end - 1]
+            if last.op == "goto" and last.a not in labels:
+                exits[n] = crossing
+            elif last.op != "goto" and n == len(blocks) - 1:
+                exits[n] = crossing
+    outs = _liveness(
+        blocks, uses, defs, exits, global_budget(code, blocks, len(crossing))
+    )
+    reached = [False] * len(blocks)
+    work = _roots(blocks, labels, entries)
+    while work:
+        n = work.pop()
+        if not reached[n]:
+            reached[n] = True
+            work.extend(blocks[n].succ)
+    keep = [True] * len(code)
+    for n, b in enumerate(blocks):
+        if not reached[n]:
+            for i in range(b.start, b.end):
+                keep[i] = code[i].op == "label"
+            continue
+        # a name is live below this point if read further down the block, or
+        # live out of it and not written in between
+        out = crossing if outs is None else outs[n]
+        live, written = set(), set()
+        for i in range(b.end - 1, b.start - 1, -1):
+            instr = code[i]
+            reads, dest = names_of(instr)
+            if dest is not None:
+                if instr.op == "assign" and instr.b == dest:
+                    keep[i] = False
+                    continue
+                dead = dest not in live and (dest in written or dest not in out)
+                if dead and _removable(instr, safe):
+                    keep[i] = False
+                    continue
+                live.discard(dest)
+                written.add(dest)
+            live.update(reads)
+    # first[i]: first kept instruction other than a label at or after i
+    first = [len(code)] * (len(code) + 1)
+    for i in range(len(code) - 1, -1, -1):
+        instr = code[i]
+        if keep[i] and instr.op in JUMPS:
+            target = branch_target(instr)
+            if target in labels:
+                p = labels[target]
+                noop = p > i and first[p] == first[i + 1]
+            else:
+                noop = instr.op != "goto"
+            if noop and (instr.op != "if_gt" or instr in safe):
+                keep[i] = False
+        first[i] = i if keep[i] and code[i].op != "label" else first[i + 1]
+    new = [instr for i, instr in enumerate(code) if keep[i]]
+    removed = [instr for i, instr in enumerate(code) if not keep[i]]
+    return new, removed
+
+
+def coalesce(code, entries=None):
+    # `binop t ...` directly followed by `assign x t`, where that is the
+    # only write and the only read of t, becomes `binop x ...`; in a piece
+    # of a program only temps qualify (code after it may read variables)
+    reads, writes = {}, {}
     for instr in code:
-        for part in (instr.a, instr.b, instr.c):
-            if isinstance(part, str) and part.startswith("t"):
-                used.add(part)
-    new = []
-    removed = []
+        r, d = names_of(instr)
+        for x in r:
+            reads[x] = reads.get(x, 0) + 1
+        if d is not None:
+            writes[d] = writes.get(d, 0) + 1
+    new, removed = [], []
     for instr in code:
+        prev = new[-1] if new else None
         if (
             instr.op == "assign"
-            and isinstance(instr.a, str)
-            and instr.a.startswith("t")
-            and instr.a not in used
+            and prev is not None
+            and prev.op == "binop"
+            and instr.b == prev.a
+            and reads.get(prev.a) == 1
+            and writes.get(prev.a) == 1
+            and (entries is None or TEMP_NAME.match(prev.a))
         ):
+            new[-1] = _rewrite(prev, "binop", instr.a, prev.b, prev.c)
             removed.append(instr)
             continue
         new.append(instr)
     return new, removed
+
+# Loop passes over the repeat pattern IRGen emits (a do-while: the body
+# runs max(N, 1) times):
+#   assign C N; label L; <body>; binop C "C - 1"; if_gt C 0 "goto L"
+UNROLL_TRIPS = 8  # full unrolling: at most this many iterations
+UNROLL_SIZE = 64  # ... and instructions, also the cap for a partially
+UNROLL_FACTOR = 4  # unrolled body of this many copies
+
+
+class Loop:
+    __slots__ = ("init", "label", "dec", "latch", "start", "end", "at", "body", "lo", "hi")
+
+    def __init__(self, init, label, start, end, at):
+        self.init = init
+        self.label = label
+        self.start = start  # index of the label and of the if_gt
+        self.end = end
+        self.at = at  # index of the init in the rewritten code
+        self.dec = self.latch = None
+        self.body = []
+        # extent of every jump to or from a label defined in the body
+        self.lo = start
+        self.hi = end
+
+    def closed(self):
+        return self.lo == self.start and self.hi == self.end
+
+
+def find_loops(code):
+    # {label index: if_gt index} of the repeat loops that can be rewritten:
+    # only the loop's own if_gt jumps to L and nothing else uses C
+    labels, defs, refs, counts = {}, {}, {}, {}
+    for i, instr in enumerate(code):
+        if instr.op == "label":
+            labels[instr.a] = i
+            defs[instr.a] = defs.get(instr.a, 0) + 1
+        target = branch_target(instr)
+        if target is not None:
+            refs.setdefault(target, []).append(i)
+        reads, dest = names_of(instr)
+        for x in reads + [dest]:
+            counts[x] = counts.get(x, 0) + 1
+    loops = {}
+    for j, instr in enumerate(code):
+        if instr.op != "if_gt" or instr.b != "0":
+            continue
+        name, counter = branch_target(instr), instr.a
+        h = labels.get(name)
+        if h is None or defs[name] != 1 or refs[name] != [j] or not 0 < h < j - 1:
+            continue
+        dec, init = code[j - 1], code[h - 1]
+        if (
+            dec.op == "binop"
+            and dec.a == counter
+            and dec.b.split() == [counter, "-", "1"]
+            and init.op == "assign"
+            and init.a == counter
+            and type(init.b) is int
+            and counts[counter] == 4
+        ):
+            loops[h] = j
+    return loops, labels, refs
+
+
+def _can_raise(instr):
+    parts = instr.b.split()
+    if len(parts) != 3 or parts[1] not in RAISING:
+        return False
+    return not all(type(operand(x)[1]) in (int, bool) and operand(x)[0] == CONST for x in (parts[0], parts[2]))
+
+
+def hoist_invariants(body, counter):
+    # Assigns and binops at the top of the body (which runs first on every
+    # iteration) whose operands the loop never writes move in front of it,
+    # provided their destination is written once and not read before. One
+    # that may raise only moves while nothing observable precedes it.
+    written = {counter: 1}
+    for instr in body:
+        dest = names_of(instr)[1]
+        if dest is not None:
+            written[dest] = written.get(dest, 0) + 1
+    pre, rest, read, effects = [], [], set(), False
+    for n, instr in enumerate(body):
+        if instr.op == "label" or instr.op in JUMPS:
+            return pre, rest + body[n:]
+        reads, dest = names_of(instr)
+        raising = instr.op == "binop" and _can_raise(instr)
+        if (
+            dest is not None
+            and written.get(dest) == 1
+            and dest not in read
+            and not any(x in written for x in reads)
+            and not (raising and effects)
+        ):
+            pre.append(instr)
+            del written[dest]
+            continue
+        rest.append(instr)
+        read.update(reads)
+        effects = effects or raising or instr.op == "print"
+    return pre, rest
+
+
+def _increment(instr):
+    # (x, c) for `binop x "x + c"` / `binop x "x - c"` with an int literal c
+    if instr.op != "binop":
+        return None
+    parts = instr.b.split()
+    if len(parts) != 3 or parts[0] != instr.a or parts[1] not in ("+", "-"):
+        return None
+    kind, c = operand(parts[2])
+    if kind != CONST or type(c) is not int:
+        return None
+    return instr.a, c if parts[1] == "+" else -c
+
+
+def reduce_inductions(body, trips):
+    # Strength reduction of induction variables in a straight-line body:
+    # when x changes only by `x = x +/- c` and nothing else in the body
+    # reads it, the `trips` iterations' updates become one binop in front
+    # of the loop. Only the pure instructions (assigns, binops that cannot
+    # raise) may precede an update that moves.
+    if any(instr.op == "label" or instr.op in JUMPS for instr in body):
+        return [], body
+    used = set()
+    for instr in body:
+        if _increment(instr) is None:
+            reads, dest = names_of(instr)
+            used.update(reads)
+            used.add(dest)
+    total, pure = {}, True
+    for instr in body:
+        inc = _increment(instr)
+        if inc is not None and inc[0] not in used:
+            x, c = inc
+            if x not in total and not pure:
+                used.add(x)
+            else:
+                total[x] = total.get(x, 0) + c
+                continue
+        pure = pure and (instr.op == "assign" or (instr.op == "binop" and not _can_raise(instr)))
+    if not total:
+        return [], body
+    pre, first = [], {}
+    for instr in body:
+        inc = _increment(instr)
+        if inc is not None and inc[0] in total and inc[0] not in first:
+            first[inc[0]] = _rewrite(
+                instr, "binop", inc[0], f"{inc[0]} + {total[inc[0]] * trips}", instr.c
+            )
+            pre.append(first[inc[0]])
+    return pre, [instr for instr in body if _increment(instr) is None or _increment(instr)[0] not in total]
+
+
+def _copy(body, taken):
+    # the body with its labels renamed apart
+    names = {}
+    for instr in body:
+        if instr.op == "label":
+            n = 1
+            while f"{instr.a}.{n}" in taken:
+                n += 1
+            names[instr.a] = f"{instr.a}.{n}"
+            taken.add(names[instr.a])
+    out = []
+    for instr in body:
+        op, a, b, c = instr.op, instr.a, instr.b, instr.c
+        if op in ("label", "goto"):
+            a = names.get(a, a)
+        elif op == "if_false":
+            b = names.get(b, b)
+        elif op == "if_gt" and branch_target(instr) in names:
+            c = f"goto {names[branch_target(instr)]}"
+        # always a new instruction: passes tell instructions apart by identity
+        new = TACInstr(op, a, b, c)
+        new.src = instr.src
+        out.append(new)
+    return out
+
+
+def _rewrite_loop(loop, taken):
+    counter = loop.init.a
+    trips = max(loop.init.b, 1)
+    pre, body = hoist_invariants(loop.body, counter)
+    ivs, body = reduce_inductions(body, trips)
+    pre += ivs
+    size = sum(instr.op != "label" for instr in body)
+    if not body:
+        return pre
+    if trips <= UNROLL_TRIPS and trips * size <= UNROLL_SIZE:
+        out = pre + body
+        for _ in range(trips - 1):
+            out += _copy(body, taken)
+        return out
+    if trips >= UNROLL_FACTOR and size * UNROLL_FACTOR <= UNROLL_SIZE:
+        q, r = divmod(trips, UNROLL_FACTOR)
+        out = pre + body
+        for _ in range(r + UNROLL_FACTOR - 1):
+            out += _copy(body, taken)
+        out[len(pre) + r * len(body) : len(pre) + r * len(body)] = [
+            _rewrite(loop.init, "assign", counter, q),
+            loop.label,
+        ]
+        return out + [loop.dec, loop.latch]
+    return pre + [loop.init, loop.label] + body + [loop.dec, loop.latch]
+
+
+def optimize_loops(code, entries=None):
+    # Hoist invariants, reduce induction variables and unroll (fully when
+    # trips * size is small, else UNROLL_FACTOR times with the remainder
+    # peeled in front) every repeat loop no outside jump enters, innermost
+    # loops first. Past LOOP_WORK body instructions per instruction of the
+    # code (deep nests rescan their inner loops) the remaining loops are
+    # left as they are.
+    loops, labels, refs = find_loops(code)
+    if not loops:
+        return code
+    taken = set(labels)
+    out, stack, work = [], [], 0
+    budget = max(GLOBAL_FLOOR, LOOP_WORK * len(code))
+    for i, instr in enumerate(code):
+        out.append(instr)
+        if i in loops:
+            if stack and loops[i] >= stack[-1].end - 1:
+                return code  # loops overlap: leave everything alone
+            stack.append(Loop(out[-2], instr, i, loops[i], len(out) - 2))
+        elif stack and i == stack[-1].end - 1:
+            stack[-1].dec = instr
+        elif stack and i == stack[-1].end:
+            loop = stack.pop()
+            loop.latch = instr
+            if stack:
+                stack[-1].lo = min(stack[-1].lo, loop.lo)
+                stack[-1].hi = max(stack[-1].hi, loop.hi)
+            if loop.closed():
+                work += len(out) - loop.at
+                if work <= budget:
+                    loop.body = out[loop.at + 2 : -2]
+                    out[loop.at :] = _rewrite_loop(loop, taken)
+        elif instr.op == "label" and stack:
+            span = refs.get(instr.a, []) + [i]
+            if entries is not None and instr.a in entries:
+                span.append(-1)  # entered from outside the code
+            stack[-1].lo = min(stack[-1].lo, min(span))
+            stack[-1].hi = max(stack[-1].hi, max(span))
+    return out
+
+
+def _call(name, fn, *args):
+    return fn(*args)
+
+
+def pass_timer(timings):
+    # a run_pass for optimize() that adds the seconds spent per pass to
+    # timings[name]
+    def call(name, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+    return call
+
+
+def optimize(code, max_rounds=10, entries=None, run_pass=None):
+    # loop passes once, then the dataflow passes until they change little
+    # (see ROUND_GAIN); returns (code, removed). Every pass runs as
+    # run_pass(name, fn, *args) (names: coalesce, loops, fold, dce) so
+    # callers can measure them.
+    call = run_pass or _call
+    code, removed = call("coalesce", coalesce, code, entries)
+    code = call("loops", optimize_loops, code, entries)
+    for _ in range(max_rounds):
+        old = code
+        code, merged = call("coalesce", coalesce, code, entries)
+        code, safe, dropped = call("fold", constant_folding, code, entries)
+        code, dead = call("dce", dead_code_elim, code, safe, entries)
+        removed += merged + dropped + dead
+        if len(code) == len(old) and all(a is b for a, b in zip(code, old)):
+            break
+        before = set(map(id, old))
+        rewritten = sum(id(instr) not in before for instr in code)
+        if (len(merged) + len(dropped) + len(dead) + rewritten) * ROUND_GAIN < len(code):
+            break
+    return code, removed
@@ -1,5 +1,7 @@
-from lexer import tokenize, Token
+from lexer import iter_tokens, Token
 from ast import *
+from collections import deque
+from sys import intern
 import sys
 
 
@@ -8,17 +10,29 @@ class ParserError(Exception):
 
 
 class Parser:
+    # tokens may be a list or any iterator (e.g. lexer.iter_tokens); they are
+    # pulled on demand, with a small buffer for lookahead
     def __init__(self, tokens):
-        self.tokens = tokens
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
         self.pos = 0
-        self.cur = tokens[0]
+        self.cur = next(self.tokens)
+
+    def _pull(self):
+        tok = next(self.tokens, None)
+        if tok is None:
+            tok = Token("EOF", "", self.cur.line, self.cur.col)
+        return tok
+
+    def peek(self, k=1):
+        # the token k positions after the current one
+        while len(self.lookahead) < k:
+            self.lookahead.append(self._pull())
+        return self.lookahead[k - 1]
 
     def advance(self):
         self.pos += 1
-        if self.pos < len(self.tokens):
-            self.cur = self.tokens[self.pos]
-        else:
-            self.cur = Token("EOF", "", self.cur.line, self.cur.col)
+        self.cur = self.lookahead.popleft() if self.lookahead else self._pull()
 
     def accept(self, typ):
         if self.cur.type == typ:
@@ -63,29 +77,30 @@ class Parser:
             return self.parse_goto()
         if self.cur.type == "PRINT":
             return self.parse_print()
-        if self.cur.type == "REPEAT":
-            return self.parse_repeat()
-        if self.cur.type == "IF":
-            return self.parse_if()
+        if self.cur.type == "REPEAT" or self.cur.type == "IF":
+            return self.parse_nested()
         # assignment? identifier ASSIGN ...
         if self.cur.type == "ID":
-            # lookahead
-            name = self.cur.value
-            self.advance()
-            if self.cur.type == "ASSIGN":
+            nxt = self.peek()
+            if nxt.type == "ASSIGN":
+                tok = self.cur
+                self.advance()
                 self.advance()
                 expr = self.parse_expr()
-                return Assign(name, expr)
+                node = Assign(intern(tok.value), expr)
+                node.line = tok.line
+                node.col = tok.col
+                return node
             else:
                 raise ParserError(
-                    f"Unexpected token after ID: {self.cur.type} at line {self.cur.line}"
+                    f"Unexpected token after ID: {nxt.type} at line {nxt.line}"
                 )
         raise ParserError(f"Unexpected token {self.cur.type} at line {self.cur.line}")
 
     def parse_step(self):
         self.expect("STEP")
         tok = self.expect_token("ID")
-        node = Step(tok.value)
+        node = Step(intern(tok.value))
         node.line = tok.line
         node.col = tok.col
         return node
@@ -93,7 +108,7 @@ class Parser:
     def parse_goto(self):
         self.expect("GOTO")
         tok = self.expect_token("ID")
-        node = Goto(tok.value)
+        node = Goto(intern(tok.value))
         node.line = tok.line
         node.col = tok.col
         return node
@@ -108,19 +123,16 @@ class Parser:
         return node
 
     def parse_repeat(self):
+        return self.parse_nested()
+
+    def parse_repeat_header(self):
+        # repeat N times {   -> Repeat node with an empty block
         self.expect("REPEAT")
         num_tok = self.expect_token("NUMBER")
         num = num_tok.value
         self.expect("TIMES")  # 'times' keyword
         self.expect("LP")  # {
-        block = []
-        while self.cur.type != "RP":
-            if self.cur.type == "NEWLINE":
-                self.advance()
-                continue
-            block.append(self.parse_statement())
-        self.expect("RP")
-        node = Repeat(int(num), block)
+        node = Repeat(int(num), [])
         node.line = num_tok.line
         node.col = num_tok.col
         return node
@@ -130,22 +142,41 @@ class Parser:
         return self.parse_expr()
 
     def parse_if(self):
+        return self.parse_nested()
+
+    def parse_if_header(self):
+        # if <cond> then {   -> If node with an empty block
         self.expect("IF")
         cond = self.parse_condition()
         self.expect("THEN")
         self.expect("LP")
-        block = []
-        while self.cur.type != "RP":
-            if self.cur.type == "NEWLINE":
-                self.advance()
-                continue
-            block.append(self.parse_statement())
-        self.expect("RP")
-        node = If(cond, block)
+        node = If(cond, [])
         node.line = getattr(cond, "line", None)
         node.col = getattr(cond, "col", None)
         return node
 
+    def parse_nested(self):
+        # a repeat/if statement and everything nested in it; open blocks are
+        # kept on an explicit stack, so nesting depth is not limited by
+        # Python's recursion limit
+        headers = {"REPEAT": self.parse_repeat_header, "IF": self.parse_if_header}
+        root = headers[self.cur.type]()
+        stack = [root]
+        while stack:
+            typ = self.cur.type
+            if typ == "NEWLINE":
+                self.advance()
+            elif typ == "RP":
+                self.advance()
+                node = stack.pop()
+                if stack:
+                    stack[-1].block.append(node)
+            elif typ in headers:
+                stack.append(headers[typ]())
+            else:
+                stack[-1].block.append(self.parse_statement())
+        return root
+
     # expression parsing (simple)
     def parse_expr(self):
         node = self.parse_term()
@@ -190,7 +221,7 @@ class Parser:
             return node
         if self.cur.type == "ID":
             tok = self.expect_token("ID")
-            name = tok.value
+            name = intern(tok.value)  # one shared string per identifier
             node = Var(name)
             node.line = tok.line
             node.col = tok.col
@@ -198,15 +229,20 @@ class Parser:
         raise ParserError(f"Unexpected term {self.cur.type} at line {self.cur.line}")
 
 
-def parse_code(code):
-    tokens = tokenize(code)
-    p = Parser(tokens)
+def parse_code(code, line=1):
+    p = Parser(iter_tokens(code, line))
+    return p.parse()
+
+
+def parse_file(f):
+    # f: an open text/binary file or an mmap; read incrementally
+    p = Parser(iter_tokens(f))
     return p.parse()
 
 
 if __name__ == "__main__":
     import sys
 
-    code = open(sys.argv[1]).read()
-    ast = parse_code(code)
+    with open(sys.argv[1]) as f:
+        ast = parse_file(f)
     print(ast)
@@ -0,0 +1,153 @@
+# Source-level execution profile. codegen.execute_profiled counts the
+# dispatches and time of every linked instruction; Profile rolls them up to
+# source lines and to the enclosing `step` for a hot-spot report and a JSON
+# dump.
+import bisect
+import json
+
+from codegen import (
+    ASSIGN,
+    BINOP,
+    CMP_EQ,
+    CMP_GE,
+    CMP_GT,
+    CMP_LE,
+    CMP_LT,
+    CMP_NE,
+    DEC_GT,
+    FAIL,
+    GOTO,
+    IF_FALSE,
+    IF_GT,
+    ICMP_EQ,
+    ICMP_GE,
+    ICMP_GT,
+    ICMP_LE,
+    ICMP_LT,
+    ICMP_NE,
+    PRINT,
+    State,
+    execute_profiled,
+)
+from sinks import as_sink
+
+OP_NAMES = {
+    PRINT: "print",
+    ASSIGN: "assign",
+    BINOP: "binop",
+    GOTO: "goto",
+    IF_GT: "if_gt",
+    IF_FALSE: "if_false",
+    FAIL: "fail",
+    DEC_GT: "dec_gt",
+    CMP_EQ: "cmp_eq",
+    CMP_NE: "cmp_ne",
+    CMP_GT: "cmp_gt",
+    CMP_LT: "cmp_lt",
+    CMP_GE: "cmp_ge",
+    CMP_LE: "cmp_le",
+    ICMP_EQ: "icmp_eq",
+    ICMP_NE: "icmp_ne",
+    ICMP_GT: "icmp_gt",
+    ICMP_LT: "icmp_lt",
+    ICMP_GE: "icmp_ge",
+    ICMP_LE: "icmp_le",
+}
+# instructions in front of the first step
+ENTRY = "(entry)"
+
+
+class Profile:
+    def __init__(self):
+        self.linked = None
+
+    def run(self, linked, sink=None, st=None, bindings=None):
+        # run like codegen.run_tac, recording into this profile (which keeps
+        # what ran even when the program raises); st names the steps
+        self.linked = linked
+        self.counts = [0] * len(linked.code)
+        self.times = [0] * len(linked.code)
+        steps = sorted(
+            (pc, name)
+            for name, pc in linked.labels.items()
+            if st is not None and st.lookup(name) == "step"
+        )
+        self.step_pcs = [pc for pc, _ in steps]
+        self.step_names = [name for _, name in steps]
+        sink = as_sink(sink)
+        execute_profiled(
+            linked, sink.write, self.counts, self.times, State(linked, bindings)
+        )
+        return sink.finish()
+
+    def step_of(self, pc):
+        i = bisect.bisect_right(self.step_pcs, pc) - 1
+        return self.step_names[i] if i >= 0 else ENTRY
+
+    def instructions(self):
+        # one record per instruction that ran, in program order
+        rows = []
+        for pc, count in enumerate(self.counts):
+            if count:
+                line, col = self.linked.src[pc] or (None, None)
+                rows.append(
+                    {
+                        "pc": pc,
+                        "op": OP_NAMES.get(self.linked.code[pc][0], "?"),
+                        "line": line,
+                        "col": col,
+                        "step": self.step_of(pc),
+                        "count": count,
+                        "time_ns": self.times[pc],
+                    }
+                )
+        return rows
+
+    def rollup(self, key):
+        # [{key, count, time_ns}] summed over instructions, hottest first
+        totals = {}
+        for row in self.instructions():
+            total = totals.setdefault(row[key], [0, 0])
+            total[0] += row["count"]
+            total[1] += row["time_ns"]
+        rows = [{key: k, "count": c, "time_ns": t} for k, (c, t) in totals.items()]
+        rows.sort(key=lambda r: -r["time_ns"])
+        return rows
+
+    def to_json(self):
+        return {
+            "instructions_executed": sum(self.counts),
+            "time_ns": sum(self.times),
+            "steps": self.rollup("step"),
+            "lines": self.rollup("line"),
+            "instructions": sorted(self.instructions(), key=lambda r: -r["time_ns"]),
+        }
+
+    def dump(self, f):
+        json.dump(self.to_json(), f, indent=2)
+
+    def report(self, top=10):
+        # hot spots by step, by source line and by instruction
+        total = sum(self.times) or 1
+        lines = [
+            f"{sum(self.counts)} instructions executed in {sum(self.times) / 1e6:.3f} ms"
+        ]
+        for title, key, rows in (
+            ("steps", "step", self.rollup("step")),
+            ("lines", "line", self.rollup("line")),
+            ("instructions", "pc", sorted(self.instructions(), key=lambda r: -r["time_ns"])),
+        ):
+            lines.append("")
+            lines.append(f"hot {title}:")
+            lines.append(f"  {key:<16}{'count':>12}{'time(ms)':>12}{'%':>7}")
+            for r in rows[:top]:
+                name = r[key]
+                if key == "pc":
+                    name = f"{name} {r['op']} @{r['line']}"
+                elif name is None:
+                    name = "?"
+                lines.append(
+                    f"  {str(name):<16}{r['count']:>12}{r['time_ns'] / 1e6:>12.3f}"
+                    f"{100 * r['time_ns'] / total:>6.1f}%"
+                )
+        return "\n".join(lines)
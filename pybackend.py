@@ -0,0 +1,199 @@
+# Ahead-of-time backend: translate a linked program into one Python function
+from codegen import (OPS, TYPED_OPS, Linked, link, _div, _idiv, _unknown_op,
+                     PRINT, ASSIGN, BINOP, GOTO, IF_GT, IF_FALSE, FAIL, CONST,
+                     DEC_GT, CMP_FN, JUMP_OPS)
+from sinks import as_sink
+
+# inline Python for the operator callables of codegen.OPS
+# ({ia} is the operand already coerced with int())
+INLINE = {
+    '+':   '{ia}+{ib}',
+    '-':   '{ia}-{ib}',
+    '*':   '{ia}*{ib}',
+    '/':   '_div({a}, {b})',
+    '==':  '({a}=={b})',
+    '!=':  '({a}!={b})',
+    '>':   '{ia}>{ib}',
+    '<':   '{ia}<{ib}',
+    '>=':  '{ia}>={ib}',
+    '<=':  '{ia}<={ib}',
+    'and': '(bool({a}) and bool({b}))',
+    'or':  '(bool({a}) or bool({b}))',
+}
+# and for the typed operators, whose operands need no coercion
+TYPED_INLINE = {
+    '+':   '{a}+{b}',
+    '-':   '{a}-{b}',
+    '*':   '{a}*{b}',
+    '/':   '_idiv({a}, {b})',
+    '==':  '({a}=={b})',
+    '!=':  '({a}!={b})',
+    '>':   '{a}>{b}',
+    '<':   '{a}<{b}',
+    '>=':  '{a}>={b}',
+    '<=':  '{a}<={b}',
+    'and': '({a} and {b})',
+    'or':  '({a} or {b})',
+}
+INLINE_BY_FN = {OPS[k]: v for k, v in INLINE.items()}
+INLINE_BY_FN[_unknown_op] = '0'
+for ops in TYPED_OPS.values():
+    INLINE_BY_FN.update((fn, TYPED_INLINE[k]) for k, fn in ops.items())
+
+
+class PyGen:
+    def __init__(self, linked):
+        self.linked = linked
+        self.lines = []
+        self.env = {'_div': _div, '_idiv': _idiv}
+
+    def val(self, slot):
+        if self.linked.kinds[slot]==CONST:
+            return repr(self.linked.init[slot])
+        return f's{slot}'
+
+    def int_val(self, slot):
+        if self.linked.kinds[slot]==CONST and type(self.linked.init[slot]) is int:
+            return repr(self.linked.init[slot])
+        return f'int({self.val(slot)})'
+
+    def str_val(self, slot):
+        if self.linked.kinds[slot]==CONST and type(self.linked.init[slot]) is str:
+            return repr(self.linked.init[slot])
+        return f'str({self.val(slot)})'
+
+    def binop(self, instr):
+        _, dest, x, fn, y = instr
+        tmpl = INLINE_BY_FN.get(fn)
+        if tmpl is None:
+            # unknown callable: call it through the function's globals
+            name = f'_f{len(self.env)}'
+            self.env[name] = fn
+            tmpl = name + '({a}, {b})'
+        return f's{dest} = ' + tmpl.format(a=self.val(x), b=self.val(y),
+                                           ia=self.int_val(x), ib=self.int_val(y))
+
+    def blocks(self):
+        code = self.linked.code
+        n = len(code)
+        leaders = {0}
+        for pc, instr in enumerate(code):
+            op = instr[0]
+            if op in JUMP_OPS:
+                leaders.update((instr[-1], pc+1))
+            elif op==FAIL:
+                leaders.add(pc+1)
+        return sorted(x for x in leaders if x < n)
+
+    def emit(self, line, depth):
+        self.lines.append('    '*depth + line)
+
+    def jump(self, target, depth):
+        if target >= len(self.linked.code):
+            self.emit('return', depth)
+        else:
+            self.emit(f'b = {self.block_id[target]}; continue', depth)
+
+    def gen_block(self, start, end, depth):
+        code = self.linked.code
+        last = code[end-1]
+        self_loop = last[0] in JUMP_OPS and last[0]!=GOTO and last[-1]==start
+        if self_loop:
+            self.emit('while True:', depth)
+            depth += 1
+        for pc in range(start, end):
+            instr = code[pc]
+            op = instr[0]
+            if op==BINOP:
+                self.emit(self.binop(instr), depth)
+            elif op==ASSIGN:
+                self.emit(f's{instr[1]} = {self.val(instr[2])}', depth)
+            elif op==PRINT:
+                self.emit(f'emit({self.str_val(instr[1])})', depth)
+            elif op==GOTO:
+                self.jump(instr[1], depth)
+                return
+            elif op==FAIL:
+                self.emit(f'raise RuntimeError({instr[1]!r})', depth)
+                return
+            elif op in JUMP_OPS:
+                if op==IF_GT:
+                    cond = f'{self.int_val(instr[1])} > {instr[2]!r}'
+                elif op==IF_FALSE:
+                    cond = f'not {self.val(instr[1])}'
+                elif op==DEC_GT:
+                    self.emit(f's{instr[1]} = int(s{instr[1]})-{instr[2]!r}', depth)
+                    cond = f's{instr[1]} > {instr[3]!r}'
+                else:
+                    _, dest, x, y, target = instr
+                    self.emit(self.binop((BINOP, dest, x, CMP_FN[op], y)), depth)
+                    cond = f'not s{dest}'
+                if self_loop:
+                    self.emit(f'if not ({cond}): break', depth)
+                    depth -= 1
+                else:
+                    self.emit(f'if {cond}:', depth)
+                    self.jump(instr[-1], depth+1)
+        self.jump(end, depth)
+
+    def gen_dispatch(self, ids, depth):
+        # bisect on the block id so dispatch costs O(log blocks) comparisons
+        if len(ids)==1:
+            start = self.leaders[ids[0]]
+            end = self.leaders[ids[0]+1] if ids[0]+1 < len(self.leaders) else len(self.linked.code)
+            self.gen_block(start, end, depth)
+            return
+        mid = len(ids)//2
+        self.emit(f'if b < {ids[mid]}:', depth)
+        self.gen_dispatch(ids[:mid], depth+1)
+        self.emit('else:', depth)
+        self.gen_dispatch(ids[mid:], depth+1)
+
+    def generate(self):
+        linked = self.linked
+        self.leaders = self.blocks()
+        self.block_id = {pc: i for i, pc in enumerate(self.leaders)}
+        self.emit('def _mf_program(emit):', 0)
+        for slot, kind in enumerate(linked.kinds):
+            if kind!=CONST:
+                self.emit(f's{slot} = {linked.init[slot]!r}', 1)
+        if not self.leaders:
+            self.emit('return', 1)
+            return '\n'.join(self.lines) + '\n'
+        self.emit('b = 0', 1)
+        self.emit('while True:', 1)
+        self.gen_dispatch(list(range(len(self.leaders))), 2)
+        return '\n'.join(self.lines) + '\n'
+
+
+def build(linked):
+    # generate the program function and compile it once; returns fn(emit)
+    gen = PyGen(linked)
+    source = gen.generate()
+    namespace = dict(gen.env)
+    exec(compile(source, '<miniflow>', 'exec'), namespace)
+    fn = namespace['_mf_program']
+    fn.source = source
+    return fn
+
+def run_pyc(code, sink=None):
+    if not isinstance(code, Linked):
+        code = link(code)
+    sink = as_sink(sink)
+    build(code)(sink.write)
+    return sink.finish()
+
+
+if __name__ == '__main__':
+    # cross-check the backend against run_tac: python pybackend.py [files...]
+    import glob, os, sys
+    from main import compile_and_run
+    from codegen import run_tac
+    files = sys.argv[1:] or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demos', '*.mf')))
+    failed = 0
+    for path in files:
+        out, tac, tacopt, st, diagnostics, removed, prog, linked = compile_and_run(open(path).read())
+        ok = run_pyc(linked) == run_tac(linked)
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {path}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,75 @@
+# Cooperative scheduler: many instances of one workflow multiplexed over a
+# single linked program. The linked code is shared and never written; an
+# instance owns only its codegen.State (pc and frame of variables) and its
+# output sink. Instances take turns round robin, each running a slice of
+# `quantum` dispatched instructions, so a long workflow (even a long
+# straight-line step) cannot starve short ones; quantum=1 yields after every
+# instruction, a negative quantum runs each instance to the end.
+from collections import deque
+
+from codegen import Linked, State, execute, link
+from sinks import as_sink
+
+READY, DONE, FAILED = "ready", "done", "failed"
+
+
+class Instance:
+    __slots__ = ("id", "linked", "state", "sink", "status", "error", "result", "slices")
+
+    def __init__(self, id, linked, sink):
+        self.id = id
+        self.linked = linked
+        self.state = State(linked)
+        self.sink = as_sink(sink)
+        self.status = READY
+        self.error = None
+        self.result = None  # the sink's result once finished
+        self.slices = 0
+
+
+class Scheduler:
+    def __init__(self, linked, quantum=1024):
+        if not isinstance(linked, Linked):
+            linked = link(linked)
+        self.linked = linked
+        self.quantum = quantum
+        self.ready = deque()
+        self.finished = []
+        self.next_id = 0
+
+    def spawn(self, sink=None, linked=None):
+        # a new instance at the program start; sink as for run_tac. Another
+        # linked program can be given for an instance of a different workflow
+        inst = Instance(
+            self.next_id, self.linked if linked is None else linked, sink
+        )
+        self.next_id += 1
+        self.ready.append(inst)
+        return inst
+
+    def step(self):
+        # run one slice of the next ready instance and return it (None when
+        # nothing is left); a finished instance leaves the queue
+        if not self.ready:
+            return None
+        inst = self.ready.popleft()
+        inst.slices += 1
+        try:
+            execute(inst.linked, inst.sink.write, inst.state, self.quantum)
+        except Exception as e:
+            inst.status = FAILED
+            inst.error = f"{type(e).__name__}: {e}"
+        else:
+            if inst.state.pc < len(inst.linked.code):
+                self.ready.append(inst)
+                return inst
+            inst.status = DONE
+        inst.result = inst.sink.finish()
+        self.finished.append(inst)
+        return inst
+
+    def run(self):
+        # until every instance finished; returns them in completion order
+        while self.ready:
+            self.step()
+        return self.finished
@@ -5,9 +5,18 @@ class SemanticError(Exception):
     pass
 
 
+# binary operators whose result is a bool; every other one gives an int
+BOOL_RESULT = frozenset(("EQ", "NE", "LT", "GT", "LE", "GE", "AND", "OR"))
+INT = frozenset(("int",))
+
+
 class SymbolTable:
     def __init__(self):
         self.table = {}
+        # variable -> runtime types of the values assigned to it, and the
+        # variables it is assigned from (see value_types)
+        self.stores = {}
+        self.copies = {}
 
     def declare(self, name, typ):
         if name in self.table:
@@ -21,84 +30,213 @@ class SymbolTable:
     def items(self):
         return self.table.items()
 
+    def update(self, other):
+        # add the declarations and assignments of a later part of a program
+        for name, typ in other.items():
+            self.declare(name, typ)
+        for name, types in other.stores.items():
+            self.stores.setdefault(name, set()).update(types)
+        for name, sources in other.copies.items():
+            self.copies.setdefault(name, set()).update(sources)
+
+    def assigned(self, name, expr):
+        if type(expr) is Var:
+            self.copies.setdefault(name, set()).add(expr.name)
+        else:
+            self.stores.setdefault(name, set()).add(value_type(expr))
+
+    def value_types(self):
+        # variable -> frozenset of the types ("int", "bool", "string") its
+        # value can have at run time, whatever the order of execution: every
+        # variable starts out as 0 and copies carry their source's types
+        types = {name: INT.union(t) for name, t in self.stores.items()}
+        changed = True
+        while changed:
+            changed = False
+            for name, sources in self.copies.items():
+                t = types.get(name, INT)
+                new = t.union(*(types.get(x, INT) for x in sources))
+                if new != t:
+                    types[name] = new
+                    changed = True
+        return types
+
+
+def value_type(expr):
+    # runtime type of a number, string or operator expression's value. An
+    # operator with a string literal operand keeps the coercing operators,
+    # and codegen.decode stores its raw text when the literal holds spaces:
+    # its value may be a string
+    t = type(expr)
+    if t is BinOp:
+        if type(expr.left) is String or type(expr.right) is String:
+            return "string"
+        return "bool" if expr.op in BOOL_RESULT else "int"
+    if t is Number:
+        return "int"
+    return "string" if t is String else None
+
 
 def check_program(prog):
     st = SymbolTable()
-    diagnostics = []
     # first pass: collect step names and variable declarations from assignments
     for s in prog.stmts:
         collect_decls(s, st)
     # second pass: type check (collect errors rather than raising)
-    for s in prog.stmts:
+    diagnostics = check_stmts(prog.stmts, st)
+    return st, diagnostics
+
+
+def check_stmts(stmts, st):
+    # type check top-level statements against a filled symbol table; one
+    # diagnostic per statement that fails
+    diagnostics = []
+    for s in stmts:
         try:
             type_check_stmt(s, st)
         except SemanticError as e:
             diagnostics.append(str(e))
-    return st, diagnostics
+    return diagnostics
+
+
+def _skip(*args):
+    pass
+
+
+# declarations: handler(stmt, st, work)
+DECLS = Dispatch(_skip)
+
+
+@DECLS.on(Step)
+def _declare_step(stmt, st, work):
+    st.declare(stmt.name, "step")
+
+
+@DECLS.on(Assign)
+def _declare_assign(stmt, st, work):
+    st.declare(stmt.name, "int")
+    st.assigned(stmt.name, stmt.expr)
+
+
+@DECLS.on(Repeat, If)
+def _declare_block(stmt, st, work):
+    work.extend(reversed(stmt.block))
 
 
 def collect_decls(stmt, st):
-    if isinstance(stmt, Step):
-        st.declare(stmt.name, "step")
-    elif isinstance(stmt, Assign):
-        st.declare(stmt.name, "int")
-    elif isinstance(stmt, Repeat):
-        for x in stmt.block:
-            collect_decls(x, st)
-    elif isinstance(stmt, If):
-        for x in stmt.block:
-            collect_decls(x, st)
-    # other statements don't declare
+    # walk nested blocks with an explicit stack (no recursion limit)
+    work = [stmt]
+    while work:
+        stmt = work.pop()
+        DECLS[type(stmt)](stmt, st, work)
+
+
+# statement checks: handler(stmt, st, work), raising SemanticError
+CHECKS = Dispatch(_skip)
+
+
+@CHECKS.on(Goto)
+def _check_goto(stmt, st, work):
+    if st.lookup(stmt.target) != "step":
+        raise SemanticError(f"Undefined step {stmt.target}")
+
+
+@CHECKS.on(Print)
+def _check_print(stmt, st, work):
+    type_of_expr(stmt.expr, st)
+
+
+@CHECKS.on(Assign)
+def _check_assign(stmt, st, work):
+    t = type_of_expr(stmt.expr, st)
+    if t != "int" and t != "string":
+        raise SemanticError(f"Cannot assign type {t} to variable {stmt.name}")
+
+
+@CHECKS.on(Repeat)
+def _check_repeat(stmt, st, work):
+    # count must be number
+    if not isinstance(stmt.count, int):
+        raise SemanticError("Repeat count must be integer literal")
+    work.extend(reversed(stmt.block))
+
+
+@CHECKS.on(If)
+def _check_if(stmt, st, work):
+    t = type_of_condition(stmt.cond, st)
+    if t != "bool":
+        raise SemanticError("If condition must be boolean")
+    work.extend(reversed(stmt.block))
 
 
 def type_check_stmt(stmt, st):
-    if isinstance(stmt, Step):
-        return
-    if isinstance(stmt, Goto):
-        if st.lookup(stmt.target) != "step":
-            raise SemanticError(f"Undefined step {stmt.target}")
-    if isinstance(stmt, Print):
-        type_of_expr(stmt.expr, st)
-    if isinstance(stmt, Assign):
-        t = type_of_expr(stmt.expr, st)
-        if t != "int" and t != "string":
-            raise SemanticError(f"Cannot assign type {t} to variable {stmt.name}")
-    if isinstance(stmt, Repeat):
-        # count must be number
-        if not isinstance(stmt.count, int):
-            raise SemanticError("Repeat count must be integer literal")
-        for x in stmt.block:
-            type_check_stmt(x, st)
-    if isinstance(stmt, If):
-        t = type_of_condition(stmt.cond, st)
-        if t != "bool":
-            raise SemanticError("If condition must be boolean")
-        for x in stmt.block:
-            type_check_stmt(x, st)
+    # pre-order over nested blocks; the first error aborts the whole statement
+    work = [stmt]
+    while work:
+        stmt = work.pop()
+        CHECKS[type(stmt)](stmt, st, work)
+
+
+def _unknown_expr(expr, st, types, work):
+    raise SemanticError("Unknown expression type")
+
+
+# expression types: handler(expr, st, types, work) pushes the type of expr
+# on `types`, or schedules (handler, node) pairs on `work`
+EXPR_TYPES = Dispatch(_unknown_expr)
+
+
+@EXPR_TYPES.on(Number)
+def _type_number(expr, st, types, work):
+    types.append("int")
+
+
+@EXPR_TYPES.on(String)
+def _type_string(expr, st, types, work):
+    types.append("string")
+
+
+@EXPR_TYPES.on(Var)
+def _type_var(expr, st, types, work):
+    t = st.lookup(expr.name)
+    if t is None:
+        raise SemanticError(f"Undefined variable {expr.name}")
+    types.append(t)
+
+
+@EXPR_TYPES.on(BinOp)
+def _type_binop(expr, st, types, work):
+    work.append((_type_operands, expr))
+    work.append((EXPR_TYPES[type(expr.right)], expr.right))
+    work.append((EXPR_TYPES[type(expr.left)], expr.left))
+
+
+def _type_operands(expr, st, types, work):
+    right = types.pop()
+    left = types.pop()
+    types.append(binop_type(expr.op, left, right))
 
 
 def type_of_expr(expr, st):
-    if isinstance(expr, Number):
-        return "int"
-    if isinstance(expr, String):
-        return "string"
-    if isinstance(expr, Var):
-        t = st.lookup(expr.name)
-        if t is None:
-            raise SemanticError(f"Undefined variable {expr.name}")
-        return t
-    if isinstance(expr, BinOp):
-        left = type_of_expr(expr.left, st)
-        right = type_of_expr(expr.right, st)
-        if expr.op in ("PLUS", "MINUS", "TIMES", "DIV"):
-            if left == "int" and right == "int":
-                return "int"
-            else:
-                raise SemanticError("Arithmetic on non-int")
-        if expr.op in ("EQ", "NE", "LT", "GT", "LE", "GE"):
-            return "bool"
-        if expr.op in ("AND", "OR"):
-            return "bool"
+    # post-order with explicit stacks, left operand before right
+    types = []
+    work = [(EXPR_TYPES[type(expr)], expr)]
+    while work:
+        fn, expr = work.pop()
+        fn(expr, st, types, work)
+    return types[0]
+
+
+def binop_type(op, left, right):
+    if op in ("PLUS", "MINUS", "TIMES", "DIV"):
+        if left == "int" and right == "int":
+            return "int"
+        else:
+            raise SemanticError("Arithmetic on non-int")
+    if op in ("EQ", "NE", "LT", "GT", "LE", "GE"):
+        return "bool"
+    if op in ("AND", "OR"):
+        return "bool"
     raise SemanticError("Unknown expression type")
 
 
@@ -0,0 +1,63 @@
+# Output sinks for run_tac: where `print` results go while a program runs.
+# A sink exposes write(line) and finish(); finish() flushes anything still
+# buffered and returns the sink's result (run_tac hands it back).
+
+
+class ListSink:
+    # the classic behaviour: collect every line and return the list
+    def __init__(self):
+        self.lines = []
+        self.write = self.lines.append
+
+    def finish(self):
+        return self.lines
+
+
+class CallbackSink:
+    # hand each line to fn as soon as it is printed
+    def __init__(self, fn):
+        self.write = fn
+
+    def finish(self):
+        return None
+
+
+class FileSink:
+    # buffered writer: lines are flushed to f once flush_lines lines or
+    # flush_bytes characters have accumulated, so memory stays bounded
+    def __init__(self, f, flush_lines=1024, flush_bytes=64 * 1024):
+        self.f = f
+        self.flush_lines = flush_lines
+        self.flush_bytes = flush_bytes
+        self.buf = []
+        self.size = 0
+        self.count = 0
+
+    def write(self, line):
+        self.buf.append(line)
+        self.size += len(line) + 1
+        if len(self.buf) >= self.flush_lines or self.size >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.buf.append("")
+            self.f.write("\n".join(self.buf))
+            self.count += len(self.buf) - 1
+            self.buf = []
+            self.size = 0
+        self.f.flush()
+
+    def finish(self):
+        self.flush()
+        return self.count
+
+
+def as_sink(sink):
+    if sink is None:
+        return ListSink()
+    if hasattr(sink, "write") and hasattr(sink, "finish"):
+        return sink
+    if callable(sink):
+        return CallbackSink(sink)
+    raise TypeError(f"Not an output sink: {sink!r}")
@@ -0,0 +1,127 @@
+# Opt-in compile telemetry for main.compile_and_run: wall time, tracemalloc
+# peak and the change in live (gc-tracked) objects of every phase and
+# optimizer pass, plus pipeline statistics. Each measurement is a flat dict
+# record handed to the registered hooks as soon as it is made, so an
+# external collector can consume them (main --timings-json writes one JSON
+# object per line).
+import gc
+import json
+import time
+import tracemalloc
+
+from ast import CHILDREN
+
+
+def count_nodes(prog):
+    # AST nodes below (and including) the program
+    count = 1
+    work = list(prog.stmts)
+    while work:
+        n = work.pop()
+        count += 1
+        work += CHILDREN[type(n)](n)
+    return count
+
+
+def _tac_out(res):
+    # passes return the new code, or a tuple starting with it
+    return {"tac_out": len(res if isinstance(res, list) else res[0])}
+
+
+class Telemetry:
+    # memory: trace allocations (tracemalloc slows every phase down several
+    # times); objects: count live objects before and after each phase
+    def __init__(self, hooks=(), memory=True, objects=True):
+        self.hooks = list(hooks)
+        self.memory = memory
+        self.objects = objects
+        self.records = []
+        self._tracing = False
+
+    def add_hook(self, fn):
+        # fn(record) is called with every record; usable as a decorator
+        self.hooks.append(fn)
+        return fn
+
+    def emit(self, record):
+        self.records.append(record)
+        for fn in self.hooks:
+            fn(record)
+
+    def phase(self, name, fn, *args, describe=None, **extra):
+        # run fn(*args) as phase `name` and emit its record, with `extra`
+        # and describe(result) merged in; returns fn's result. A phase that
+        # raises is recorded too, with "error" set.
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        objects = len(gc.get_objects()) if self.objects else None
+        if self.memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        record = {"event": "phase", "phase": name}
+        record.update(extra)
+        start = time.perf_counter()
+        try:
+            res = fn(*args)
+        except BaseException as e:
+            record["error"] = type(e).__name__
+            raise
+        else:
+            if describe is not None:
+                record.update(describe(res))
+        finally:
+            record["wall_s"] = time.perf_counter() - start
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record["mem_peak_bytes"] = peak
+                record["mem_delta_bytes"] = current - before
+            if objects is not None:
+                record["objects_delta"] = len(gc.get_objects()) - objects
+            self.emit(record)
+        return res
+
+    def run_pass(self, name, fn, *args):
+        # optimizer.optimize run_pass hook: a phase per pass invocation,
+        # with the TAC length going in and coming out
+        return self.phase(name, fn, *args, describe=_tac_out, tac_in=len(args[0]))
+
+    def stats(self, **values):
+        self.emit(dict(event="stats", **values))
+
+    def close(self):
+        # stop tracing if this object started it
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def summary(self):
+        # per phase name: calls, wall time, highest peak, objects; then stats
+        phases = {}
+        stats = {}
+        for r in self.records:
+            if r["event"] == "stats":
+                stats.update((k, v) for k, v in r.items() if k != "event")
+                continue
+            p = phases.setdefault(r["phase"], [0, 0.0, None, None])
+            p[0] += 1
+            p[1] += r["wall_s"]
+            if "mem_peak_bytes" in r:
+                p[2] = max(p[2] or 0, r["mem_peak_bytes"])
+            if "objects_delta" in r:
+                p[3] = (p[3] or 0) + r["objects_delta"]
+        lines = [f"{'phase':<10}{'calls':>7}{'wall(ms)':>11}{'peak(KiB)':>12}{'objects':>10}"]
+        for name, (calls, wall, peak, objs) in phases.items():
+            lines.append(
+                f"{name:<10}{calls:>7}{wall * 1000:>11.2f}"
+                f"{'-' if peak is None else f'{peak / 1024:.0f}':>12}"
+                f"{'-' if objs is None else objs:>10}"
+            )
+        for k, v in stats.items():
+            lines.append(f"{k} : {v}")
+        return "\n".join(lines)
+
+    def dump(self, f):
+        # JSON lines, one record each
+        for r in self.records:
+            f.write(json.dumps(r) + "\n")
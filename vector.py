@@ -0,0 +1,423 @@
+# Vectorized batch execution: one linked program run over N sets of initial
+# variable bindings (a parameter sweep) at once, with per-lane output equal
+# to N separate codegen.run_tac(linked, None, bindings) calls.
+#
+# Lanes at the same pc form a group with one frame; a slot holds either a
+# python value shared by every lane of the group or a NumPy array with one
+# entry per lane (int64, bool, or object for anything else). Arithmetic and
+# comparisons on int64/bool arrays are array ops; everything else (strings,
+# ints that could overflow int64, operators that raise) is evaluated lane by
+# lane with the interpreter's own operator functions. A conditional jump on
+# an array splits the group into the lanes that jump and those that fall
+# through; groups are run lowest pc first, so lanes that diverged meet again
+# at a later pc and are merged there. Groups smaller than `min_lanes` finish
+# on the scalar interpreter (codegen.execute), as does everything without
+# NumPy.
+from ast import import_past_ast
+
+# NumPy is optional
+try:
+    np = import_past_ast("numpy")
+except ImportError:
+    np = None
+
+from codegen import (
+    ASSIGN,
+    BINOP,
+    CMP_EQ,
+    CMP_FN,
+    DEC_GT,
+    FAIL,
+    GOTO,
+    IF_GT,
+    OPS,
+    PRINT,
+    TYPED_OPS,
+    VAR,
+    Linked,
+    State,
+    check_bindable,
+    execute,
+    link,
+)
+from main import compile_program
+
+# int64 arrays only hold values below this in magnitude, so that + and - of
+# two of them cannot wrap
+LIMIT = 1 << 62
+
+_SUB = OPS["-"]
+_GT = OPS[">"]
+
+
+def compile_for_bindings(code):
+    # source -> linked program for runs with bindings: optimized without
+    # assuming that variables start at 0
+    prog, st, diagnostics, tac, removed = compile_program(code, bindings=True)
+    return link(tac, st, bindable=True)
+
+
+def _bound(v):
+    return int(np.abs(v).max()) if isinstance(v, np.ndarray) else abs(v)
+
+
+def _add(x, y):
+    return np.add(x, y) if _bound(x) + _bound(y) < LIMIT else None
+
+
+def _sub(x, y):
+    return np.subtract(x, y) if _bound(x) + _bound(y) < LIMIT else None
+
+
+def _mul(x, y):
+    return np.multiply(x, y) if _bound(x) * _bound(y) < LIMIT else None
+
+
+def _div(x, y):
+    # floor division like codegen._div, 0 where the divisor is 0
+    zero = np.equal(y, 0)
+    return np.where(zero, 0, np.floor_divide(x, np.where(zero, 1, y)))
+
+
+def _and(x, y):
+    return np.logical_and(np.not_equal(x, 0), np.not_equal(y, 0))
+
+
+def _or(x, y):
+    return np.logical_or(np.not_equal(x, 0), np.not_equal(y, 0))
+
+
+# array kernels by interpreter operator function; they take int64 arrays or
+# python ints (bools already converted) and return None when the result
+# might not fit
+if np is not None:
+    KERNELS = {
+        OPS["+"]: _add,
+        OPS["-"]: _sub,
+        OPS["*"]: _mul,
+        OPS["/"]: _div,
+        OPS["=="]: np.equal,
+        OPS["!="]: np.not_equal,
+        OPS[">"]: np.greater,
+        OPS["<"]: np.less,
+        OPS[">="]: np.greater_equal,
+        OPS["<="]: np.less_equal,
+        OPS["and"]: _and,
+        OPS["or"]: _or,
+    }
+    for ops in TYPED_OPS.values():
+        KERNELS.update((fn, KERNELS[OPS[k]]) for k, fn in ops.items())
+
+
+def _ints(v):
+    # v as a kernel operand, or None if it is not an int or a bool
+    if isinstance(v, np.ndarray):
+        if v.dtype == np.int64:
+            return v
+        return v.astype(np.int64) if v.dtype == np.bool_ else None
+    if type(v) is bool:
+        return int(v)
+    return v if type(v) is int and -LIMIT < v < LIMIT else None
+
+
+def _lanes(v, k):
+    return v.tolist() if isinstance(v, np.ndarray) else [v] * k
+
+
+def _objects(values):
+    a = np.empty(len(values), dtype=object)
+    a[:] = values
+    return a
+
+
+def _pack(values):
+    # slot value for a group from one python value per lane
+    first = values[0]
+    t = type(first)
+    if all(type(v) is t and v == first for v in values):
+        return first
+    if all(type(v) is bool for v in values):
+        return np.array(values, dtype=np.bool_)
+    if all(type(v) is int and -LIMIT < v < LIMIT for v in values):
+        return np.array(values, dtype=np.int64)
+    return _objects(values)
+
+
+def _kind(v):
+    # "b", "i" or "O": what an array of v would hold
+    if isinstance(v, np.ndarray):
+        return v.dtype.kind
+    if type(v) is bool:
+        return "b"
+    return "i" if type(v) is int and -LIMIT < v < LIMIT else "O"
+
+
+def _concat(parts, sizes):
+    # one slot of merged groups
+    first = parts[0]
+    if not any(isinstance(p, np.ndarray) for p in parts):
+        t = type(first)
+        if all(type(p) is t and p == first for p in parts):
+            return first
+    kinds = {_kind(p) for p in parts}
+    if kinds == {"b"} or kinds == {"i"}:
+        dtype = np.bool_ if kinds == {"b"} else np.int64
+        return np.concatenate(
+            [
+                p if isinstance(p, np.ndarray) else np.full(k, p, dtype=dtype)
+                for p, k in zip(parts, sizes)
+            ]
+        )
+    values = []
+    for p, k in zip(parts, sizes):
+        values += _lanes(p, k)
+    return _objects(values)
+
+
+def _truth(v):
+    # bool or bool array: the lanes where v is true
+    if not isinstance(v, np.ndarray):
+        return bool(v)
+    if v.dtype == object:
+        return np.array([bool(x) for x in v.tolist()], dtype=np.bool_)
+    return v != 0
+
+
+class Group:
+    # lanes (indices into the batch) at one pc, sharing one frame
+    __slots__ = ("pc", "lanes", "frame")
+
+    def __init__(self, pc, lanes, frame):
+        self.pc = pc
+        self.lanes = lanes
+        self.frame = frame
+
+    def take(self, mask):
+        return Group(
+            self.pc,
+            self.lanes[mask],
+            [v[mask] if isinstance(v, np.ndarray) else v for v in self.frame],
+        )
+
+
+class Batch:
+    # one run of `linked` over a list of binding dicts; run() fills outputs
+    # (lines per lane) and errors (per lane "Type: message" of what run_tac
+    # would raise, or None)
+    def __init__(self, linked, bindings, min_lanes=8):
+        if not isinstance(linked, Linked):
+            linked = link(linked)
+        if bindings:
+            check_bindable(linked)
+        self.linked = linked
+        self.bindings = bindings
+        self.min_lanes = max(1, min_lanes)
+        self.outputs = [[] for _ in bindings]
+        self.errors = [None] * len(bindings)
+        self.groups = {}  # pc -> groups waiting there
+        self.slices = 0  # vectorized runs between two scheduling decisions
+        self.scalar_lanes = 0  # lanes finished on the scalar interpreter
+
+    def _frame(self):
+        # the initial frame over all lanes
+        linked = self.linked
+        frame = list(linked.init)
+        names = {}
+        for b in self.bindings:
+            names.update(dict.fromkeys(b))
+        for name in names:
+            s = linked.slot_of(name)
+            if s is None or linked.kinds[s] != VAR:
+                raise KeyError(f"No variable {name} in the program")
+            frame[s] = _pack([b.get(name, frame[s]) for b in self.bindings])
+        return frame
+
+    def run(self):
+        if not self.bindings:
+            return self
+        if np is None:
+            for i, b in enumerate(self.bindings):
+                self._scalar(i, State(self.linked, b))
+            return self
+        g = Group(0, np.arange(len(self.bindings)), self._frame())
+        self._wait(g)
+        n = len(self.linked.code)
+        while self.groups:
+            pc = min(self.groups)
+            waiting = self.groups.pop(pc)
+            if pc >= n:
+                continue
+            g = waiting[0] if len(waiting) == 1 else self._merge(waiting)
+            if len(g.lanes) < self.min_lanes:
+                self._fallback(g)
+                continue
+            self.slices += 1
+            self._run(g)
+        return self
+
+    def _wait(self, g):
+        self.groups.setdefault(g.pc, []).append(g)
+
+    def _merge(self, groups):
+        sizes = [len(g.lanes) for g in groups]
+        frame = [
+            _concat([g.frame[i] for g in groups], sizes)
+            for i in range(len(groups[0].frame))
+        ]
+        return Group(groups[0].pc, np.concatenate([g.lanes for g in groups]), frame)
+
+    def _scalar(self, lane, state):
+        try:
+            execute(self.linked, self.outputs[lane].append, state)
+        except Exception as e:
+            self.errors[lane] = f"{type(e).__name__}: {e}"
+        self.scalar_lanes += 1
+
+    def _fallback(self, g):
+        # finish every lane of g on the scalar interpreter
+        k = len(g.lanes)
+        columns = [_lanes(v, k) for v in g.frame]
+        for j, lane in enumerate(g.lanes.tolist()):
+            state = State(self.linked)
+            state.pc = g.pc
+            state.frame = [c[j] for c in columns]
+            self._scalar(lane, state)
+
+    def _fail(self, g, failed):
+        # drop lanes {position in g: exception} from g; False if none is left
+        keep = np.ones(len(g.lanes), dtype=np.bool_)
+        lanes = g.lanes.tolist()
+        for j, e in failed.items():
+            keep[j] = False
+            self.errors[lanes[j]] = f"{type(e).__name__}: {e}"
+        if not keep.any():
+            return False
+        rest = g.take(keep)
+        g.lanes, g.frame = rest.lanes, rest.frame
+        return True
+
+    def _apply(self, g, fn, a, b):
+        # fn(a, b) over the lanes of g; lanes where it raises are dropped.
+        # Returns the result, or None if no lane is left.
+        if not isinstance(a, np.ndarray) and not isinstance(b, np.ndarray):
+            try:
+                return fn(a, b)
+            except Exception as e:
+                self._fail(g, dict.fromkeys(range(len(g.lanes)), e))
+                return None
+        kernel = KERNELS.get(fn)
+        if kernel is not None:
+            x = _ints(a)
+            y = None if x is None else _ints(b)
+            if y is not None:
+                r = kernel(x, y)
+                if r is not None:
+                    return r
+        k = len(g.lanes)
+        values, failed = [], {}
+        for j, (x, y) in enumerate(zip(_lanes(a, k), _lanes(b, k))):
+            try:
+                values.append(fn(x, y))
+            except Exception as e:
+                failed[j] = e
+        if failed and not self._fail(g, failed):
+            return None
+        return _pack(values)
+
+    def _branch(self, g, taken, target):
+        # jump the lanes where `taken`; True if g has to be rescheduled
+        if not isinstance(taken, np.ndarray):
+            g.pc = target if taken else g.pc + 1
+            return taken
+        if taken.all():
+            g.pc = target
+            return True
+        if not taken.any():
+            g.pc += 1
+            return False
+        other = g.take(taken)
+        other.pc = target
+        self._wait(other)
+        rest = g.take(~taken)
+        g.lanes, g.frame = rest.lanes, rest.frame
+        g.pc += 1
+        return True
+
+    def _run(self, g):
+        # run g until it jumps, splits, ends, runs into a waiting group or
+        # loses all its lanes; it is queued again unless it is gone
+        code = self.linked.code
+        groups = self.groups
+        outputs = self.outputs
+        n = len(code)
+        frame = g.frame
+        while g.pc < n:
+            instr = code[g.pc]
+            op = instr[0]
+            if op == BINOP:
+                _, dest, x, fn, y = instr
+                v = self._apply(g, fn, frame[x], frame[y])
+                if v is None:
+                    return
+                frame = g.frame
+                frame[dest] = v
+                g.pc += 1
+            elif op == ASSIGN:
+                frame[instr[1]] = frame[instr[2]]
+                g.pc += 1
+            elif op == PRINT:
+                v = frame[instr[1]]
+                if isinstance(v, np.ndarray):
+                    for lane, x in zip(g.lanes.tolist(), v.tolist()):
+                        outputs[lane].append(str(x))
+                else:
+                    s = str(v)
+                    for lane in g.lanes.tolist():
+                        outputs[lane].append(s)
+                g.pc += 1
+            elif op == GOTO:
+                g.pc = instr[1]
+                break
+            elif op == FAIL:
+                self._fail(g, dict.fromkeys(range(len(g.lanes)), RuntimeError(instr[1])))
+                return
+            else:
+                if op == DEC_GT:
+                    _, c, d, k, target = instr
+                    v = self._apply(g, _SUB, frame[c], d)
+                    if v is None:
+                        return
+                    frame = g.frame
+                    frame[c] = v
+                    taken = _truth(self._apply(g, _GT, v, k))
+                elif op >= CMP_EQ:
+                    _, dest, x, y, target = instr
+                    v = self._apply(g, CMP_FN[op], frame[x], frame[y])
+                    if v is None:
+                        return
+                    frame = g.frame
+                    frame[dest] = v
+                    taken = ~_truth(v) if isinstance(v, np.ndarray) else not v
+                elif op == IF_GT:
+                    _, x, k, target = instr
+                    v = self._apply(g, _GT, frame[x], k)
+                    if v is None:
+                        return
+                    frame = g.frame
+                    taken = _truth(v)
+                else:  # IF_FALSE
+                    _, x, target = instr
+                    v = _truth(frame[x])
+                    taken = ~v if isinstance(v, np.ndarray) else not v
+                if self._branch(g, taken, target):
+                    break
+                frame = g.frame
+            if g.pc in groups:
+                break
+        self._wait(g)
+
+
+def run_batch(code, bindings, min_lanes=8):
+    # -> (outputs, errors), one entry per binding dict (see Batch)
+    batch = Batch(code, bindings, min_lanes).run()
+    return batch.outputs, batch.errors